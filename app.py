@@ -2,20 +2,26 @@
 # File: app.py
 # Purpose: Application entry point
 # Created: January 24, 2024
-# Modified: October 5, 2024
+# Modified: October 18, 2026
 
-from pydantic import BaseModel, PositiveInt
+from pydantic import BaseModel, NonNegativeInt, PositiveFloat, PositiveInt
+from time import perf_counter
+from typing import Literal, Optional
+import asyncio
+import hashlib
 import json
 import logging
 import os
+import signal
 import socket
+import sys
 
 import discord
 from discord.ext import commands
 from discord.ext.commands import Bot
 from discord.ext.commands.errors import MissingRequiredArgument
 
-from lib import logger_resetup, logger_setup, mkerrembed
+from lib import db_close, db_setup, eventlog, eventlog_setup, log_setup, logger_resetup, logger_setup, metrics, mkerrembed
 
 class CogDef(BaseModel):
     enabled: bool
@@ -27,6 +33,31 @@ class Config(BaseModel):
     token: str
     cogpath: str
     cogs: list[CogDef]
+    # Seconds a database operation waits on a locked database before giving up
+    db_busy_timeout: float = 5.0
+    # Threads used for database reads, writes always use a single thread
+    db_readers: PositiveInt = 2
+    # Compiled statements kept per database connection
+    db_cached_statements: PositiveInt = 256
+    # Database connections each database thread keeps open
+    db_thread_connections: PositiveInt = 64
+    # Messages kept in the message cache of the client, the cogs do not depend on it
+    max_messages: Optional[PositiveInt] = 1000
+    # Port to serve the bot's own timings on in the Prometheus text format, off if not set. Only listens on localhost unless metrics_host is changed.
+    metrics_port: Optional[PositiveInt] = None
+    metrics_host: str = "127.0.0.1"
+    # Lowest level of log messages that are kept by loggers without a level of their own, such as the ones of pycord that are not redirected to sys_log
+    log_level: Literal["DEBUG", "INFO", "WARNING", "ERROR"] = "INFO"
+    # Log files are rotated when they reach log_max_bytes ("size") or at log_when ("time", such as "midnight" or "H"), keeping log_backups gzipped old files
+    log_rotate: Literal["size", "time"] = "size"
+    log_max_bytes: PositiveInt = 10 * 1024 * 1024
+    log_when: str = "midnight"
+    log_backups: NonNegativeInt = 5
+    # Structured log of guild, member and message events in eventlog_dir that can be searched with eventquery.py. Events are written in blocks of at most eventlog_block events, at least every eventlog_interval seconds.
+    eventlog: bool = False
+    eventlog_dir: str = "data/events"
+    eventlog_block: PositiveInt = 1000
+    eventlog_interval: PositiveFloat = 10.0
 
 with open("./config.json") as f:
     config_raw = f.read()
@@ -34,8 +65,12 @@ with open("./config.json") as f:
 config_dict = json.loads(config_raw)
 config = Config(**config_dict)
 
+db_setup(config.db_busy_timeout, config.db_readers, config.db_cached_statements, config.db_thread_connections)
+log_setup(config.log_level, config.log_rotate, config.log_max_bytes, config.log_backups, config.log_when)
+eventlog_setup(config.eventlog, config.eventlog_dir, config.eventlog_block, config.eventlog_interval)
+
 intents = discord.Intents.all()
-client = commands.Bot(command_prefix = "$", auto_sync_commands = False, intents = intents, help_command = None, activity = discord.Activity(type=discord.ActivityType.watching, name = f"from {socket.gethostname()}"))
+client = commands.Bot(command_prefix = "$", auto_sync_commands = False, intents = intents, help_command = None, max_messages = config.max_messages, activity = discord.Activity(type=discord.ActivityType.watching, name = f"from {socket.gethostname()}"))
 
 
 if not os.path.exists("log"):
@@ -49,20 +84,164 @@ logger_resetup(logging.getLogger("discord.http"), "log/sys_log.log")
 logger_resetup(logging.getLogger("discord.client"), "log/sys_log.log")
 logger_resetup(logging.getLogger("discord.gateway"), "log/sys_log.log")
 
+# Run the warmup() of a cog, if it has one, and log how long it took
+async def warmupcog(name):
+    module = sys.modules[f"cogs.{name}"]
+    if not hasattr(module, "warmup"):
+        return
+
+    start = perf_counter()
+    try:
+        await module.warmup(client)
+        sys_logger.info(f"Cog {name} warmed up in {perf_counter() - start:.3f}s")
+    except Exception:
+        sys_logger.exception(f"Cog {name} failed to warm up")
+
+# Cogs are imported and registered one at a time since that has to happen on the event loop, the heavier work each cog has in warmup(), such as creating databases and filling caches, is then run for every cog at once.
+# A cog module can define "async def warmup(client)", it is called once after every cog has been registered and before connecting. Blocking work such as sqlite3 calls goes in asyncio.to_thread(), and since the cogs warm up at the same time, shared directories such as data/ are created with os.makedirs(exist_ok = True).
+async def loadcogs():
+    start = perf_counter()
+
+    loaded = []
+    for cog in config.cogs:
+        if not cog.enabled:
+            sys_logger.info(f"Cog {cog.name} is disabled")
+            continue
+
+        cogstart = perf_counter()
+        try:
+            client.load_extension(f"cogs.{cog.name}")
+            sys_logger.info(f"Cog {cog.name} registered in {perf_counter() - cogstart:.3f}s")
+            loaded.append(cog.name)
+        except Exception:
+            sys_logger.exception(f"Cog {cog.name} failed to load")
+
+    await asyncio.gather(*[warmupcog(name) for name in loaded])
+
+    sys_logger.info(f"Loaded {len(loaded)} cogs in {perf_counter() - start:.3f}s")
+
+# Hash of every registered command as it would be sent to Discord, along with the application it is registered for
+def commandhash():
+    commands = []
+    for cmd in client.pending_application_commands:
+        data = cmd.to_dict()
+        data.pop("id", None)
+        # pycord keeps these as sets, so their order changes from one run to the next
+        for key in ("contexts", "integration_types"):
+            if data.get(key):
+                data[key] = sorted(data[key])
+        commands.append(data)
+
+    commands.sort(key = lambda data: (data["name"], data.get("type", 1)))
+
+    return hashlib.sha256(json.dumps([client.user.id, commands], sort_keys = True, default = str).encode()).hexdigest()
+
+# Commands are only sent to Discord when they changed since the last time they were. Otherwise the command IDs saved back then are used, which is all pycord needs to route interactions to the commands.
+async def synccommands():
+    path = "data/commands.json"
+    cmdhash = commandhash()
+
+    try:
+        with open(path) as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        saved = {}
+
+    ids = saved.get("ids", {})
+    keys = [f"{cmd.name}:{cmd.to_dict().get('type', 1)}" for cmd in client.pending_application_commands]
+    if saved.get("hash") == cmdhash and all(key in ids for key in keys):
+        for cmd, key in zip(client.pending_application_commands, keys):
+            cmd.id = ids[key]
+            client._application_commands[cmd.id] = cmd
+
+        sys_logger.info(f"Commands unchanged, skipped syncing {len(keys)} commands")
+        return
+
+    start = perf_counter()
+    await client.sync_commands()
+    sys_logger.info(f"Synced {len(client.pending_application_commands)} commands in {perf_counter() - start:.3f}s")
+
+    ids = {f"{cmd.name}:{cmd.to_dict().get('type', 1)}": cmd.id for cmd in client.application_commands}
+
+    os.makedirs("data/", exist_ok = True)
+    with open(path, "w") as f:
+        json.dump({"hash": cmdhash, "ids": ids}, f, indent = 4)
+
+# Time every slash command, pycord runs these hooks around the command whether it succeeds or fails
+@client.before_invoke
+async def command_start(ctx):
+    ctx.starttime = perf_counter()
+
+@client.after_invoke
+async def command_end(ctx):
+    metrics.observe("command", ctx.command.qualified_name, perf_counter() - ctx.starttime)
+
+async def startmetrics():
+    metrics.gauge("gateway_latency_seconds", lambda: client.latency)
+    metrics.gauge("guilds", lambda: len(client.guilds))
+    metrics.start()
+
+    if config.metrics_port:
+        await metrics.serve(config.metrics_port, config.metrics_host)
+        sys_logger.info(f"Serving metrics on {config.metrics_host}:{config.metrics_port}")
+
+# Set once the commands have been synced, on_ready fires again every time the gateway connection is re-established
+synced = False
+
 @client.event
 async def on_ready():
+    global synced
+
     sys_logger.info(f"Bot logged in as: {client.user}")
-    
-    for cog in config.cogs:
-        try: 
-            if client.load_extension(f"cogs.{cog.name}"):
-               sys_logger.info(f"Cog {cog.name} registered")
-            else:
-                sys_logger.warning(f"Cog {cog.name} failed to load")
-        except:
-            sys_logger.warning(f"Cog {cog.name} failed to load")
 
-    await client.sync_commands()
+    if not synced:
+        await synccommands()
+        synced = True
+
+# Run the bot until it is stopped, then unload the cogs while the event loop is still running, so they can write out anything they still have queued and close their connections
+async def main():
+    # Cogs are loaded once before connecting, so their listeners also see the first on_ready and nothing is loaded again on reconnects
+    await loadcogs()
+    await startmetrics()
+
+    try:
+        await client.start(config.token)
+    finally:
+        before = asyncio.all_tasks()
+        for extension in list(client.extensions):
+            client.unload_extension(extension)
+
+        # cog_unload is not a coroutine, so anything asynchronous such as closing an HTTP session can only be started there and is waited for here
+        started = asyncio.all_tasks() - before
+        if started:
+            await asyncio.wait(started, timeout = 5.0)
+
+        if not client.is_closed():
+            await client.close()
 
 if __name__ == "__main__":
-    client.run(config.token)
\ No newline at end of file
+    loop = client.loop
+    task = loop.create_task(main())
+
+    # Stopping on a signal goes through the finally of main() instead of stopping the loop under it, as client.run() would
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, task.cancel)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    try:
+        loop.run_until_complete(task)
+    except (asyncio.CancelledError, KeyboardInterrupt):
+        sys_logger.info("Received signal to terminate bot and event loop")
+    finally:
+        # Anything else still running, such as tasks started by listeners
+        pending = asyncio.all_tasks(loop)
+        for pendingtask in pending:
+            pendingtask.cancel()
+        loop.run_until_complete(asyncio.gather(*pending, return_exceptions = True))
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+
+        eventlog.stop()
+        db_close()
@@ -0,0 +1,88 @@
+# SLAG - CTCL 2024
+# File: bench/micron_devinfo.py
+# Purpose: Micro-benchmark of devinfo() in the micron cog against the decoder of the old cog
+# Created: October 18, 2026
+# Modified: October 18, 2026
+
+# Run from the repository root:
+#   python bench/micron_devinfo.py
+#   python bench/micron_devinfo.py --number 5000 --show
+
+import argparse
+import ast
+import os
+import sys
+import timeit
+
+# The cogs read their config relative to the repository root, the same as when run by app.py
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(root)
+sys.path.insert(0, root)
+
+from cogs.micron import devinfo
+from lib import hsize
+
+# devinfo() and its tables from old/cogs/micron/__init__.py, without importing the rest of the old cog
+def olddevinfo():
+    with open("old/cogs/micron/__init__.py") as f:
+        tree = ast.parse(f.read())
+
+    names = ("dram_types_dict", "depths", "widths", "devinfo")
+    body = []
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef) and node.name in names:
+            body.append(node)
+        elif isinstance(node, ast.Assign) and any(isinstance(target, ast.Name) and target.id in names for target in node.targets):
+            body.append(node)
+
+    namespace = {"hsize": hsize}
+    exec(compile(ast.Module(body = body, type_ignores = []), "old/cogs/micron/__init__.py", "exec"), namespace)
+
+    return namespace["devinfo"]
+
+def main():
+    parser = argparse.ArgumentParser(description = "Compare devinfo() with the decoder of the old micron cog")
+    parser.add_argument("--corpus", default = "bench/fixtures/partnumbers.txt", help = "Part numbers, one per line - defaults to bench/fixtures/partnumbers.txt")
+    parser.add_argument("--number", type = int, default = 2000, help = "Passes over the corpus per timing - defaults to 2000")
+    parser.add_argument("--show", action = "store_true", help = "Print what each part number decodes to")
+    args = parser.parse_args()
+
+    corpus = []
+    expected = {}
+    with open(args.corpus) as f:
+        for line in f:
+            if not line.strip() or line.startswith("#"):
+                continue
+            pn, sep, density = line.partition("=")
+            corpus.append(pn.strip())
+            if sep:
+                expected[pn.strip()] = density.strip()
+
+    old = olddevinfo()
+
+    newonly = 0
+    for pn in corpus:
+        oldres = old(pn)
+        newres = devinfo(pn)
+        if args.show:
+            print(f"{pn:<26} {newres}")
+
+        # Anything the old decoder knew has to decode the same, flash and Elpida parts are new
+        if oldres and oldres != newres:
+            print(f"{pn}: devinfo() returned {newres}, the old decoder {oldres}")
+            sys.exit(1)
+        if newres and not oldres:
+            newonly += 1
+
+        if pn in expected and ((newres or {}).get("density") or "").strip() != expected[pn]:
+            print(f"{pn}: devinfo() decoded the density as {(newres or {}).get('density')!r}, expected {expected[pn]!r}")
+            sys.exit(1)
+
+    oldtime = min(timeit.repeat(lambda: [old(pn) for pn in corpus], number = args.number, repeat = 3)) / (args.number * len(corpus)) * 1e6
+    newtime = min(timeit.repeat(lambda: [devinfo(pn) for pn in corpus], number = args.number, repeat = 3)) / (args.number * len(corpus)) * 1e6
+
+    print(f"{len(corpus)} part numbers, {newonly} only decoded by devinfo(), {len(expected)} densities checked")
+    print(f"old decoder {oldtime:.2f} us per call, devinfo() {newtime:.2f} us per call, {oldtime / newtime:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# SLAG - CTCL 2024
+# File: bench/micron_parse.py
+# Purpose: Benchmark of firstcell() in the micron cog against BeautifulSoup on saved FBGA result pages
+# Created: October 18, 2026
+# Modified: October 18, 2026
+
+# Run from the repository root:
+#   python bench/micron_parse.py
+#   python bench/micron_parse.py --number 50 bench/fixtures/fbga_hit.html
+
+import argparse
+import glob
+import os
+import sys
+import timeit
+
+# The cogs read their config relative to the repository root, the same as when run by app.py
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(root)
+sys.path.insert(0, root)
+
+from bs4 import BeautifulSoup
+
+from cogs.micron import firstcell
+
+# What the lookup did before firstcell()
+def bs4cell(text):
+    cell = BeautifulSoup(text, "html.parser").find("td")
+    if cell:
+        return cell.text
+
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(description = "Compare firstcell() with BeautifulSoup on saved FBGA pages")
+    parser.add_argument("pages", nargs = "*", help = "HTML files - defaults to bench/fixtures/fbga_*.html")
+    parser.add_argument("--number", type = int, default = 20, help = "Parses per timing - defaults to 20")
+    args = parser.parse_args()
+
+    pages = args.pages or sorted(glob.glob("bench/fixtures/fbga_*.html"))
+
+    print(f"{'page':<24} {'size':>8} {'bs4 ms':>10} {'firstcell ms':>13} {'speedup':>8}  result")
+    for path in pages:
+        with open(path) as f:
+            text = f.read()
+
+        expected = bs4cell(text)
+        result = firstcell(text)
+        if result != expected:
+            print(f"{path}: firstcell() returned {result!r}, BeautifulSoup {expected!r}")
+            sys.exit(1)
+
+        # Best of three, so a busy machine does not skew one side
+        bs4time = min(timeit.repeat(lambda: bs4cell(text), number = args.number, repeat = 3)) / args.number * 1000
+        newtime = min(timeit.repeat(lambda: firstcell(text), number = args.number, repeat = 3)) / args.number * 1000
+
+        print(f"{os.path.basename(path):<24} {len(text):>8} {bs4time:>10.2f} {newtime:>13.3f} {bs4time / newtime:>7.0f}x  {result!r}")
+
+if __name__ == "__main__":
+    main()
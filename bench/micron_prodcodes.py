@@ -0,0 +1,105 @@
+# SLAG - CTCL 2024
+# File: bench/micron_prodcodes.py
+# Purpose: Benchmark of the production code decoder in the micron cog over every valid production code
+# Created: October 18, 2026
+# Modified: October 18, 2026
+
+# Run from the repository root:
+#   python bench/micron_prodcodes.py
+#   python bench/micron_prodcodes.py --random 0
+
+import argparse
+import itertools
+import os
+import random
+import re
+import string
+import sys
+from datetime import datetime
+from time import perf_counter
+
+# The cogs read their config relative to the repository root, the same as when run by app.py
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(root)
+sys.path.insert(0, root)
+
+from cogs.micron import decodeprodcode, decodeprodcodes, location_dict, week_dict
+
+# The checks of micron_prod_code in old/cogs/micron/__init__.py, returning the embed values instead of building the embed
+def olddecode(code):
+    code = code.upper()
+
+    if not re.match("[A-Z0-9]+", code):
+        return None
+
+    yearcode = code[0]
+    startyear = 199
+    prodyear = ""
+    try:
+        while int(str(startyear) + str(yearcode)) <= datetime.now().year:
+            prodyear += str(startyear) + str(yearcode) + ", "
+            startyear += 1
+
+        prodyear = prodyear[:-2]
+    except:
+        return None
+
+    try:
+        weekcode = week_dict[code[1]]
+    except KeyError:
+        return None
+
+    if not re.match("[A-Z]+", code[2]):
+        return None
+
+    try:
+        return (prodyear, weekcode, code[2], location_dict[code[3]], location_dict[code[4]])
+    except KeyError:
+        return None
+
+# decodeprodcode() results in the same shape as olddecode()
+def asold(info):
+    if not info:
+        return None
+
+    return (", ".join(str(year) for year in info["years"]), info["weeks"][1], info["dierev"], info["diffused"], info["packaged"])
+
+def timed(func, *args):
+    start = perf_counter()
+    res = func(*args)
+
+    return res, perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description = "Compare the production code decoder with the old command over every valid production code")
+    parser.add_argument("--random", type = int, default = 200000, help = "Random 5 character codes, mostly invalid, checked as well - defaults to 200000")
+    args = parser.parse_args()
+
+    corpus = ["".join(chars) for chars in itertools.product(string.digits, week_dict, string.ascii_uppercase, location_dict, location_dict)]
+
+    oldres, oldtime = timed(lambda: [olddecode(code) for code in corpus])
+    bulkres, bulktime = timed(decodeprodcodes, corpus)
+    oneres, onetime = timed(lambda: [decodeprodcode(code) for code in corpus])
+
+    for code, old, one in zip(corpus, oldres, oneres):
+        if asold(bulkres[code]) != old or asold(one) != old:
+            print(f"{code}: decoded as {one}, the old command gives {old}")
+            sys.exit(1)
+
+    print(f"{len(corpus)} valid production codes")
+    for name, seconds in (("old command", oldtime), ("decodeprodcode()", onetime), ("decodeprodcodes()", bulktime)):
+        print(f"{name:<18} {seconds:6.2f} s, {seconds / len(corpus) * 1e6:5.2f} us per code")
+
+    alphabet = string.digits + string.ascii_uppercase
+    rng = random.Random(0)
+    for _ in range(args.random):
+        code = "".join(rng.choice(alphabet) for _ in range(5))
+        if asold(decodeprodcode(code)) != olddecode(code):
+            print(f"{code}: decoded as {decodeprodcode(code)}, the old command gives {olddecode(code)}")
+            sys.exit(1)
+
+    if args.random:
+        print(f"{args.random} random codes decode the same")
+
+if __name__ == "__main__":
+    main()
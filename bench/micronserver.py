@@ -0,0 +1,149 @@
+# SLAG - CTCL 2024
+# File: bench/micronserver.py
+# Purpose: Local stand-in for the Micron FBGA decoder website, for testing the micron cog without sending requests to Micron
+# Created: October 18, 2026
+# Modified: October 18, 2026
+
+# Serve the fixture pages and point the cog at it with "micron_url": "http://127.0.0.1:8080/fbga" in cogs/micron/config.json:
+#   python bench/micronserver.py --port 8080 --delay 0.2
+# Or check that the session of the cog reuses its connections, with the server on a free port:
+#   python bench/micronserver.py --selftest 200
+
+import argparse
+import asyncio
+import csv
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter, sleep
+from urllib.parse import parse_qs, urlparse
+
+# The cogs read their config relative to the repository root, the same as when run by app.py
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(root)
+sys.path.insert(0, root)
+
+# Part number in fbga_hit.html that is replaced with the one of the code asked for
+fixturepn = "MT41K256M16TW-107:P"
+
+class FBGAServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, codes, delay, verbose = False):
+        super().__init__(address, FBGAHandler)
+        self.codes = codes
+        self.delay = delay
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+
+        with open("bench/fixtures/fbga_hit.html") as f:
+            self.hit = f.read()
+        with open("bench/fixtures/fbga_miss.html") as f:
+            self.miss = f.read()
+
+class FBGAHandler(BaseHTTPRequestHandler):
+    # Keep-alive, as with the real website
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != "/fbga":
+            self.send_error(404)
+            return
+
+        with self.server.lock:
+            self.server.requests += 1
+
+        # Stands in for the time the real website takes to answer
+        if self.server.delay:
+            sleep(self.server.delay)
+
+        code = parse_qs(url.query).get("fbga", [""])[0].upper()
+        pn = self.server.codes.get(code)
+        if pn:
+            body = self.server.hit.replace(fixturepn, pn).encode()
+        else:
+            body = self.server.miss.encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+def loadcodes(path):
+    with open(path, newline = "") as f:
+        return {row["fbga"].upper(): row["partnumber"] for row in csv.DictReader(f)}
+
+# Fetch "count" codes through the session of the cog, as a bulk lookup does, and check the results and how many connections it took
+async def selftest(server, count):
+    import cogs.micron as micron
+
+    lookup = micron.FBGALookup()
+    url = f"http://127.0.0.1:{server.server_address[1]}/fbga"
+    codes = list(server.codes) + ["D9ZZZ"]
+    semaphore = asyncio.Semaphore(micron.config.bulk_concurrency)
+    wrong = 0
+
+    async def fetchone(i):
+        nonlocal wrong
+        code = codes[i % len(codes)]
+        async with semaphore:
+            async with lookup.getsession().get(url, params = {"fbga": code}) as response:
+                text = await response.text()
+        pn = await asyncio.to_thread(micron.firstcell, text)
+        if pn != server.codes.get(code):
+            wrong += 1
+
+    start = perf_counter()
+    await asyncio.gather(*[fetchone(i) for i in range(count)])
+    seconds = perf_counter() - start
+    await lookup.close()
+
+    print(f"{server.requests} requests over {server.connections} connections in {seconds:.2f} seconds, {wrong} wrong part numbers")
+    print(f"At most {micron.config.http_limit_per_host} connections are expected, http_limit_per_host in cogs/micron/config.json")
+
+    return wrong == 0 and server.connections <= micron.config.http_limit_per_host
+
+def main():
+    parser = argparse.ArgumentParser(description = "Local stand-in for the Micron FBGA decoder website")
+    parser.add_argument("--host", default = "127.0.0.1", help = "Address to listen on - defaults to 127.0.0.1")
+    parser.add_argument("--port", type = int, default = 8080, help = "Port to listen on - defaults to 8080")
+    parser.add_argument("--codes", default = "bench/fixtures/fbgacodes.csv", help = "CSV of fbga,partnumber as written by /micron export - defaults to bench/fixtures/fbgacodes.csv")
+    parser.add_argument("--delay", type = float, default = 0.0, help = "Seconds to wait before answering")
+    parser.add_argument("--verbose", action = "store_true", help = "Log every request")
+    parser.add_argument("--selftest", type = int, metavar = "COUNT", help = "Fetch COUNT codes through the session of the micron cog and exit")
+    args = parser.parse_args()
+
+    port = 0 if args.selftest else args.port
+    server = FBGAServer((args.host, port), loadcodes(args.codes), args.delay, args.verbose)
+
+    if args.selftest:
+        threading.Thread(target = server.serve_forever, daemon = True).start()
+        ok = asyncio.run(selftest(server, args.selftest))
+        server.shutdown()
+        sys.exit(0 if ok else 1)
+
+    print(f"Serving {len(server.codes)} FBGA codes on http://{args.host}:{server.server_address[1]}/fbga")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"{server.requests} requests over {server.connections} connections")
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
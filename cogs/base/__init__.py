@@ -2,30 +2,101 @@
 # File: cogs/base.py
 # Purpose: Base command definitions
 # Created: January 26, 2024
-# Modified: October 5, 2024
+# Modified: October 18, 2026
 
-import multiprocessing
+import asyncio
 import os
 import platform
-import re
 import socket
-import subprocess
 import sys
 import time
 
 import discord
-import psutil
 from discord.errors import NotFound
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord.ext.commands import Cog, has_permissions
 from discord.ext.commands.errors import MemberNotFound
 
-from lib import kb2hsize, msgsplit
+from lib import kb2hsize, metrics, msgsplit
+
+# Facts about the host shown by /sysinfo. The ones that do not change are read once when the cog is loaded, the CPU frequencies and memory usage are kept current by refresh(). Everything is read from /proc and /sys directly, where they exist.
+class HostInfo:
+    def __init__(self):
+        # CTCL hardware-specific fields that checks environment variables, e.g. for CTCL-SVCS-SLAG /etc/environment as of February 10, 2024:
+        # hwcodename="Lisdexamfetamine"
+        # hwshcodename="LDX"
+        # hwtype="virtual"
+        syscodename = os.environ.get("hwcodename")
+        sysshcodename = os.environ.get("hwshcodename")
+        systype = os.environ.get("hwtype")
+
+        hostname = socket.gethostname()
+        if syscodename and sysshcodename:
+            if systype == "virtual":
+                self.system = f"{hostname} hosted on \"{syscodename}\" (\"{sysshcodename}\")"
+            else:
+                self.system = f"{hostname} \"{syscodename}\" (\"{sysshcodename}\")"
+        else:
+            self.system = hostname
+
+        # Same fields in the same order as "uname -a"
+        uname = platform.uname()
+        self.uname = f"{uname.system} {uname.node} {uname.release} {uname.version} {uname.machine}"
+
+        self.cpumodel = None
+        for line in self.readlines("/proc/cpuinfo"):
+            if line.startswith("model name"):
+                self.cpumodel = line.split(":", 1)[1].strip()
+
+        self.threads = os.cpu_count()
+
+        self.freqs = []
+        self.mem = {}
+        self.refresh()
+
+    @staticmethod
+    def readlines(path):
+        try:
+            with open(path) as f:
+                return f.read().splitlines()
+        except OSError:
+            return []
+
+    # Current frequency of each processor in MHz, from cpufreq if the kernel has it and /proc/cpuinfo otherwise
+    def readfreqs(self):
+        freqs = []
+        for cpu in range(self.threads or 0):
+            khz = self.readlines(f"/sys/devices/system/cpu/cpu{cpu}/cpufreq/scaling_cur_freq")
+            if not khz:
+                return [float(line.split(":", 1)[1]) for line in self.readlines("/proc/cpuinfo") if line.startswith("cpu MHz")]
+            freqs.append(int(khz[0]) / 1000)
+
+        return freqs
+
+    # Fields of /proc/meminfo in kB. Keys are matched exactly, so Cached is not mistaken for SwapCached.
+    def readmem(self):
+        mem = {}
+        for line in self.readlines("/proc/meminfo"):
+            key, _, value = line.partition(":")
+            fields = value.split()
+            if fields:
+                mem[key] = int(fields[0])
+
+        return mem
+
+    def refresh(self):
+        self.freqs = self.readfreqs()
+        self.mem = self.readmem()
+
+hostinfo = HostInfo()
 
 class Base(Cog):
     def __init__(self, client):
         self.client = client
 
+    def cog_unload(self):
+        self.hostinfo_refresh.cancel()
+
     @discord.slash_command(name = "help")
     async def _help(self, ctx: discord.ApplicationContext):
         help_text_user = """
@@ -38,87 +109,39 @@ class Base(Cog):
      
         await ctx.respond(embed = embed)
 
+    @Cog.listener()
+    async def on_ready(self):
+        if not self.hostinfo_refresh.is_running():
+            self.hostinfo_refresh.start()
+
+    # Keeps the CPU frequencies and memory usage shown by /sysinfo current without reading /proc on every use of the command
+    @tasks.loop(seconds = 10)
+    async def hostinfo_refresh(self):
+        await asyncio.to_thread(hostinfo.refresh)
+
     @discord.slash_command()
     async def sysinfo(self, ctx: discord.ApplicationContext):
         embed = discord.Embed(title="Host System Information", color=0x999999)
 
-        # CTCL hardware-specific fields that checks environment variables, e.g. for CTCL-SVCS-SLAG /etc/environment as of February 10, 2024:
-        # hwcodename="Lisdexamfetamine"
-        # hwshcodename="LDX"
-        # hwtype="virtual"
-
-        try:
-            syscodename = os.environ["hwcodename"]
-        except KeyError:
-            syscodename = None
+        embed.add_field(name = "System", value = hostinfo.system, inline = False)
+        embed.add_field(name = "uname -a output", value = hostinfo.uname, inline = False)
 
-        try:
-            sysshcodename = os.environ["hwshcodename"]
-        except KeyError:
-            sysshcodename = None
+        if hostinfo.cpumodel:
+            embed.add_field(name = "Host CPU", value = hostinfo.cpumodel, inline = False)
 
-        try:
-            systype = os.environ["hwtype"]
-        except KeyError:
-            systype = None
+        embed.add_field(name = "CPU thread count", value = hostinfo.threads, inline = False)
 
-        hostname = socket.gethostname()
-        if syscodename and sysshcodename:
-            if os.environ["hwtype"] == "virtual":
-                embed.add_field(name = "System", value = f"{hostname} hosted on \"{syscodename}\" (\"{sysshcodename}\")", inline = False)
-            else:
-                embed.add_field(name = "System", value = f"{hostname} \"{syscodename}\" (\"{sysshcodename}\")", inline = False)
-        else:
-            embed.add_field(name = "System", value = f"{hostname}", inline = False)
+        for count, freq in enumerate(hostinfo.freqs):
+            embed.add_field(name = f"CPU frequency - Processor {count}", value = f"{int(freq)} MHz", inline = True)
 
-        uname = subprocess.check_output("uname -a", shell = True).decode().strip()
-        embed.add_field(name = "uname -a output", value = uname, inline = False)
+        mem = hostinfo.mem
+        if "MemTotal" in mem and "MemFree" in mem:
+            embed.add_field(name = "Host Memory Total", value = kb2hsize(mem["MemTotal"]), inline = True)
+            embed.add_field(name = "Host Memory Free", value = kb2hsize(mem["MemFree"]), inline = True)
 
-        cpuinfo = subprocess.check_output("cat /proc/cpuinfo", shell = True).decode().strip()
-        for line in cpuinfo.split("\n"):
-            if "model name" in line:
-                cpumodel = re.sub( ".*model name.*:", "", line,1)
-        embed.add_field(name = "Host CPU", value = cpumodel, inline = False)
-     
-        embed.add_field(name = "CPU thread count", value = multiprocessing.cpu_count(), inline = False)
-     
-        count = 0
-        for freq in psutil.cpu_freq(True):
-            # For some reason, psutil would either return GHz or MHz depending on the CPU(?)
-            if freq.current < 10:
-                corefreq = str(int(freq.current * 1000)) + " MHz"
-            else:
-                corefreq = str(int(freq.current)) + " MHz"
-     
-            embed.add_field(name = f"CPU frequency - Processor {count}", value = corefreq, inline = True)
-            count += 1
-     
-        # /proc/memfree is Linux-specific
-        if os.name == "posix" and os.path.exists("/proc/meminfo"):
-            meminfo = subprocess.check_output("cat /proc/meminfo", shell = True).decode().strip()
-            for line in meminfo.split("\n"):
-                if 'MemTotal' in line: 
-                    x = line.split()
-                    memtotal = x[1]
-        
-                if 'MemFree' in line: 
-                    x = line.split()
-                    memfree = x[1]
-
-                # Get buffers and cache to calculate memory free to applications
-                if 'Buffers' in line:
-                    x = line.split()
-                    membuffers = x[1]
-
-                if 'Cached' in line:
-                    x = line.split()
-                    memcached = x[1]
-
-            if memcached and membuffers and memfree:
-                actualmemfree = int(memfree) + int(memcached) + int(membuffers)
-                embed.add_field(name = "Host Memory Total", value = kb2hsize(memtotal), inline = True)
-                embed.add_field(name = "Host Memory Free", value = kb2hsize(memfree), inline = True)
-                embed.add_field(name = "Actual Host Memory Free", value = kb2hsize(actualmemfree), inline = True)
+            # Buffers and cache are counted as memory free to applications
+            actualmemfree = mem["MemFree"] + mem.get("Buffers", 0) + mem.get("Cached", 0)
+            embed.add_field(name = "Actual Host Memory Free", value = kb2hsize(actualmemfree), inline = True)
 
         await ctx.respond(embed = embed)
 
@@ -199,6 +222,34 @@ class Base(Cog):
             await targetchannel.send(msg)
             await ctx.respond(f"Sent list to {targetchannel.mention}")
 
+    # Shows where the bot spends its time, see Metrics in lib.py
+    @discord.slash_command(name = "botstats")
+    @has_permissions(administrator = True)
+    async def botstats(self, ctx: discord.ApplicationContext,
+        count: discord.Option(int, "Entries to show of each kind - defaults to 8", min_value = 1, max_value = 20, required = False)):
+
+        if not count:
+            count = 8
+
+        embed = discord.Embed(title = "Bot Statistics", color = 0x999999)
+
+        embed.add_field(name = "Gateway latency", value = f"{self.client.latency * 1000:.1f} ms", inline = True)
+
+        lag = metrics.histograms.get(("loop", "lag"))
+        if lag and lag.count:
+            embed.add_field(name = "Event loop lag", value = f"p50 {lag.quantile(0.5) * 1000:.1f} ms, p99 {lag.quantile(0.99) * 1000:.1f} ms, max {lag.max * 1000:.1f} ms", inline = True)
+
+        for kind, title in (("command", "Commands"), ("listener", "Listeners"), ("db", "Database")):
+            lines = []
+            for name, hist in metrics.top(kind, count):
+                lines.append(f"`{name}`: {hist.count}x, avg {hist.sum / hist.count * 1000:.1f} ms, p99 {hist.quantile(0.99) * 1000:.1f} ms, max {hist.max * 1000:.1f} ms")
+
+            if lines:
+                # Embed fields are limited to 1024 characters
+                embed.add_field(name = f"{title} by total time", value = msgsplit(1000, lines)[0], inline = False)
+
+        await ctx.respond(embed = embed)
+
     @discord.slash_command(name = "leaveguild")
     @has_permissions(administrator = True)
     async def leaveguild(self, ctx: discord.ApplicationContext, guildid: discord.Option(str, "Guild ID", required = True)):
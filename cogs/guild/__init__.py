@@ -0,0 +1,251 @@
+# SLAG - CTCL 2024
+# File: cogs/guild/__init__.py
+# Purpose: Guild action logging extension
+# Created: October 18, 2026
+# Modified: October 18, 2026
+
+import asyncio
+import json
+import os
+import sqlite3
+from collections import Counter
+from time import time
+
+import discord
+from discord import default_permissions
+from discord.ext.commands import Cog
+from discord.commands import SlashCommandGroup
+from pydantic import BaseModel, PositiveFloat, PositiveInt
+
+from lib import BatchWriter, PeriodicFlush, eventlog, getdb, logger_setup, metrics
+
+if not os.path.exists("log/"):
+    os.mkdir("log/")
+
+cog_logger = logger_setup("guild_logger", "log/guild.log")
+
+class GuildConfig(BaseModel):
+    # Guild actions are written to guildlog.db in batches, once this many are queued or after this many seconds
+    writer_size: PositiveInt = 500
+    writer_interval: PositiveFloat = 5.0
+    # Actions are posted to the log channel of a guild as one message every post_interval seconds, or sooner once post_events are waiting
+    post_interval: PositiveFloat = 5.0
+    post_events: PositiveInt = 25
+    # Most actions listed in one message, the rest are only counted, such as during a raid
+    post_max_events: PositiveInt = 50
+    # Seconds between two messages to log channels, Discord allows 5 messages per 5 seconds in a channel
+    post_min_gap: PositiveFloat = 1.5
+
+with open("cogs/guild/config.json") as f:
+    config_raw = f.read()
+
+config = GuildConfig(**json.loads(config_raw))
+
+guildlogdb = getdb("data/guild/guildlog.db")
+
+guildwriter = BatchWriter(maxsize = config.writer_size, interval = config.writer_interval)
+
+# Actions waiting to be posted to the log channel of each guild and sent as one message per guild, so a raid does not turn into one API call per action
+class LogPoster(PeriodicFlush):
+    def __init__(self, client):
+        super().__init__(config.post_interval)
+        self.client = client
+        # Guild ID to log channel ID
+        self.channels = {}
+        # Guild ID to a list of (event, line)
+        self.pending = {}
+        self.count = 0
+
+    async def load(self):
+        self.channels = dict(await guildlogdb.fetchall("SELECT guildid, channelid FROM logchannel"))
+
+    def put(self, guildid, event, line):
+        if guildid not in self.channels:
+            return
+
+        self.pending.setdefault(guildid, []).append((event, line))
+        self.count += 1
+
+        self.queued(self.count >= config.post_events)
+
+    async def _flush(self):
+        if self.pending:
+            await self.post()
+            await asyncio.sleep(config.post_min_gap)
+
+    async def post(self):
+        pending = self.pending
+        self.pending = {}
+        self.count = 0
+
+        for guildid, actions in pending.items():
+            channel = self.client.get_channel(self.channels.get(guildid, 0))
+            if not channel:
+                cog_logger.warning(f"Log channel of guild {guildid} not found, {len(actions)} actions not posted")
+                continue
+
+            try:
+                await channel.send(embed = mklogembed(actions))
+            except Exception as err:
+                # Such as a missing permission or a network error, the other guilds still get theirs
+                cog_logger.error(f"Posting {len(actions)} actions to the log channel of guild {guildid} failed: {err!r}")
+
+    # Posting needs the event loop, so at unload what is left is only logged. The actions themselves are already in guildlog.db.
+    def _drain(self):
+        if self.count:
+            cog_logger.warning(f"{self.count} actions in {len(self.pending)} guilds not posted to log channels at unload")
+
+        self.pending = {}
+        self.count = 0
+
+# One embed listing the actions, anything past post_max_events or the length limit of an embed description is summed up by type
+def mklogembed(actions):
+    embed = discord.Embed(title = "Guild Log", color = 0x999999)
+
+    lines = []
+    length = 0
+    rest = Counter()
+    for event, line in actions:
+        # Embed descriptions are limited to 4096 characters, some are left for the summary
+        if len(lines) < config.post_max_events and length + len(line) + 1 <= 3800:
+            lines.append(line)
+            length += len(line) + 1
+        else:
+            rest[event] += 1
+
+    if rest:
+        lines.append(f"... and {sum(rest.values())} more: " + ", ".join(f"{count} {event}" for event, count in rest.most_common()))
+
+    embed.description = "\n".join(lines)
+
+    return embed
+
+# Names of the fields that differ between two versions of a role or channel
+def changed(before, after, fields):
+    return [field for field in fields if getattr(before, field, None) != getattr(after, field, None)]
+
+class Guild(Cog):
+    def __init__(self, client):
+        self.client = client
+        self.poster = LogPoster(client)
+
+    def cog_unload(self):
+        self.poster.stop()
+        guildwriter.stop()
+
+    # Write an action to guildlog.db and the event log, and queue it for the log channel of the guild
+    def record(self, guildid, event, line, userid = None, targetid = None, details = None):
+        timestamp = time()
+
+        guildwriter.put(guildlogdb.path, "INSERT INTO guildlog VALUES(?, ?, ?, ?, ?, ?)", (timestamp, guildid, event, userid, targetid, details))
+        eventlog.write(event, guild = guildid, user = userid, target = targetid)
+        self.poster.put(guildid, event, f"<t:{int(timestamp)}:T> {line}")
+
+    guildlog = SlashCommandGroup("guildlog", "Guild action logging")
+
+    @guildlog.command(name = "config", description = "Set the channel guild actions are posted in")
+    @default_permissions(administrator = True)
+    async def guildlog_config(self, ctx: discord.ApplicationContext, channel: discord.Option(discord.TextChannel, "Channel to post guild actions in - leave out to stop posting", required = False)):
+        if not ctx.guild:
+            await ctx.respond("This command must be used in a guild")
+            return
+
+        if channel:
+            await guildlogdb.execute("INSERT OR REPLACE INTO logchannel VALUES(?, ?)", (ctx.guild.id, channel.id))
+            self.poster.channels[ctx.guild.id] = channel.id
+            await ctx.respond(f"Guild actions will be posted in {channel.mention}")
+        else:
+            await guildlogdb.execute("DELETE FROM logchannel WHERE guildid = ?", (ctx.guild.id,))
+            self.poster.channels.pop(ctx.guild.id, None)
+            await ctx.respond("Guild actions will no longer be posted")
+
+    @Cog.listener()
+    @metrics.timed("listener")
+    async def on_member_join(self, member):
+        self.record(member.guild.id, "member_join", f":inbox_tray: {member.mention} ({member}) joined", userid = member.id)
+
+    # The raw event also arrives for members that are not in the member cache
+    @Cog.listener()
+    @metrics.timed("listener")
+    async def on_raw_member_remove(self, payload):
+        self.record(payload.guild_id, "member_remove", f":outbox_tray: {payload.user.mention} ({payload.user}) left", userid = payload.user.id)
+
+    @Cog.listener()
+    @metrics.timed("listener")
+    async def on_member_ban(self, guild, user):
+        self.record(guild.id, "member_ban", f":hammer: {user.mention} ({user}) was banned", userid = user.id)
+
+    @Cog.listener()
+    @metrics.timed("listener")
+    async def on_member_unban(self, guild, user):
+        self.record(guild.id, "member_unban", f":unlock: {user.mention} ({user}) was unbanned", userid = user.id)
+
+    @Cog.listener()
+    @metrics.timed("listener")
+    async def on_member_update(self, before, after):
+        if before.roles == after.roles:
+            return
+
+        added = [role for role in after.roles if role not in before.roles]
+        removed = [role for role in before.roles if role not in after.roles]
+
+        for role in added:
+            self.record(after.guild.id, "member_role_add", f":heavy_plus_sign: {after.mention} was given {role.mention}", userid = after.id, targetid = role.id)
+        for role in removed:
+            self.record(after.guild.id, "member_role_remove", f":heavy_minus_sign: {after.mention} lost {role.mention}", userid = after.id, targetid = role.id)
+
+    @Cog.listener()
+    @metrics.timed("listener")
+    async def on_guild_role_create(self, role):
+        self.record(role.guild.id, "role_create", f":new: Role {role.mention} created", targetid = role.id)
+
+    @Cog.listener()
+    @metrics.timed("listener")
+    async def on_guild_role_delete(self, role):
+        self.record(role.guild.id, "role_delete", f":wastebasket: Role `{role.name}` deleted", targetid = role.id)
+
+    @Cog.listener()
+    @metrics.timed("listener")
+    async def on_guild_role_update(self, before, after):
+        # Reordering roles updates the position of every role below, which is left out
+        fields = changed(before, after, ("name", "permissions", "color", "hoist", "mentionable"))
+        if fields:
+            self.record(after.guild.id, "role_update", f":pencil2: Role {after.mention} changed: {', '.join(fields)}", targetid = after.id, details = ",".join(fields))
+
+    @Cog.listener()
+    @metrics.timed("listener")
+    async def on_guild_channel_create(self, channel):
+        self.record(channel.guild.id, "channel_create", f":new: Channel {channel.mention} created", targetid = channel.id)
+
+    @Cog.listener()
+    @metrics.timed("listener")
+    async def on_guild_channel_delete(self, channel):
+        self.record(channel.guild.id, "channel_delete", f":wastebasket: Channel `#{channel.name}` deleted", targetid = channel.id)
+
+    @Cog.listener()
+    @metrics.timed("listener")
+    async def on_guild_channel_update(self, before, after):
+        # As with roles, changes of position alone are left out
+        fields = changed(before, after, ("name", "category", "topic", "nsfw", "slowmode_delay", "overwrites"))
+        if fields:
+            self.record(after.guild.id, "channel_update", f":pencil2: Channel {after.mention} changed: {', '.join(fields)}", targetid = after.id, details = ",".join(fields))
+
+# Create or upgrade guildlog.db
+def createdb():
+    os.makedirs("data/guild/", exist_ok = True)
+
+    dbc = sqlite3.connect("data/guild/guildlog.db")
+    with open("cogs/guild/guildlog.sql") as f:
+        dbc.executescript(f.read())
+    dbc.commit()
+    dbc.close()
+
+async def warmup(client):
+    await asyncio.to_thread(createdb)
+
+    cog = client.get_cog("Guild")
+    if cog:
+        await cog.poster.load()
+
+def setup(client):
+    client.add_cog(Guild(client))
@@ -0,0 +1,15 @@
+CREATE TABLE IF NOT EXISTS guildlog (
+    timestamp REAL,
+    guildid INT,
+    event TEXT,
+    userid INT,
+    targetid INT,
+    details TEXT
+);
+
+CREATE INDEX IF NOT EXISTS guildlog_guild_time ON guildlog (guildid, timestamp);
+
+CREATE TABLE IF NOT EXISTS logchannel (
+    guildid INT PRIMARY KEY,
+    channelid INT
+);
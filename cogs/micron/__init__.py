@@ -0,0 +1,901 @@
+# SLAG - CTCL 2024
+# File: cogs/micron/__init__.py
+# Purpose: Micron FBGA decoder and code lookup cog
+# Created: February 6, 2024
+# Modified: October 18, 2026
+
+import asyncio
+import csv
+import io
+import json
+import os
+import re
+import sqlite3
+from datetime import datetime
+from functools import lru_cache
+from html.parser import HTMLParser
+from time import time
+
+import aiohttp
+import discord
+from discord import default_permissions
+from discord.ext.commands import Cog
+from discord.commands import SlashCommandGroup
+from pydantic import BaseModel, NonNegativeFloat, PositiveFloat, PositiveInt
+
+from lib import BatchWriter, LRUCache, getdb, hsize, logger_setup, mkerrembed, msgsplit
+
+if not os.path.exists("log/"):
+    os.mkdir("log/")
+
+cog_logger = logger_setup("micron_logger", "log/micron.log")
+
+class MicronConfig(BaseModel):
+    micron_url: str = "https://www.micron.com/support/tools-and-utilities/fbga"
+    # Connections kept open to the Micron website and how long idle ones are kept
+    http_limit_per_host: PositiveInt = 4
+    http_keepalive: PositiveFloat = 60.0
+    # Seconds before a lookup request is given up on
+    http_timeout: PositiveFloat = 15.0
+    # Days before a cached part number or a cached "no part number" result is checked again, 0 keeps it forever
+    positive_ttl: NonNegativeFloat = 0
+    negative_ttl: NonNegativeFloat = 30.0
+    # FBGA codes kept in memory in front of knowncodes.db, filled with the most recently used codes on startup
+    lru_size: PositiveInt = 1024
+    # Requests sent to the Micron website at once by a bulk lookup, and the most codes one bulk lookup takes
+    bulk_concurrency: PositiveInt = 4
+    bulk_max: PositiveInt = 500
+
+with open("cogs/micron/config.json") as f:
+    config_raw = f.read()
+
+config = MicronConfig(**json.loads(config_raw))
+
+micron_url = config.micron_url
+
+knowncodesdb = getdb("data/micron/knowncodes.db")
+
+# Last use times of cached codes only decide what is loaded into memory on startup, so they are written lazily
+lastusedwriter = BatchWriter(maxsize = 100, interval = 60.0)
+
+# Info from numdram.xlsx May 4, 2023
+dram_types_dict = {
+    "40A": {"type": "DDR4 SDRAM", "voltage": "1.2", "vtokenlength": 1, "islpddr": False},
+    "41J": {"type": "DDR3 SDRAM", "voltage": "1.5", "vtokenlength": 1, "islpddr": False},
+    "41K": {"type": "DDR3 SDRAM", "voltage": "1.35", "vtokenlength": 1, "islpddr": False},
+    "41L": {"type": "LPDDR2 Mobile", "voltage": "1.2", "vtokenlength": 1, "islpddr": True},
+    "44K": {"type": "RLDRAM3", "voltage": "1.35", "vtokenlength": 1, "islpddr": False},
+    "46V": {"type": "DDR1 SDRAM", "voltage": "2.5", "vtokenlength": 1, "islpddr": False},
+    "46H": {"type": "DDR1 SDRAM", "voltage": "1.8", "vtokenlength": 2, "islpddr": False},
+    "47H": {"type": "DDR2 SDRAM", "voltage": "1.35", "vtokenlength": 1, "islpddr": False},
+    "48H": {"type": "SDRAM", "voltage": "1.8", "vtokenlength": 1, "islpddr": False},
+    "48H": {"type": "LPSDRAM Mobile", "voltage": "1.8", "vtokenlength": 1, "islpddr": True},
+    "48L": {"type": "SDR SDRAM", "voltage": "3.3", "vtokenlength": 2, "islpddr": False},
+    "49H": {"type": "RLDRAM2", "voltage": "1.8", "vtokenlength": 1, "islpddr": False},
+    "51J": {"type": "GDDR5", "voltage": "1.5", "vtokenlength": 1, "islpddr": False},
+    "51K": {"type": "GDDR5", "voltage": "1.4", "vtokenlength": 1, "islpddr": False},
+    "52H": {"type": "LPDDR3 Mobile", "voltage": "1.8", "vtokenlength": 2, "islpddr": False},
+    "52K": {"type": "DDR3L Mobile", "voltage": "1.35", "vtokenlength": 1, "islpddr": False},
+    "52L": {"type": "LPDDR3 Mobile", "voltage": "1.2", "vtokenlength": 1, "islpddr": True},
+    "53B": {"type": "LPDRR4 Mobile", "voltage": "1.1", "vtokenlength": 1, "islpddr": True},
+    "53D": {"type": "LPDDR4X Mobile", "voltage": "1.1", "vtokenlength": 1, "islpddr": True},
+    "53E": {"type": "LPDDR4 Mobile", "voltage": "1.1", "vtokenlength": 1, "islpddr": True},
+    "53E": {"type": "LPDDR4X Mobile", "voltage": "1.1", "vtokenlength": 1, "islpddr": True},
+    "58K": {"type": "GDDR5", "voltage": "1.35", "vtokenlength": 1, "islpddr": False},
+    "58K": {"type": "GDDR5X", "voltage": "1.35", "vtokenlength": 1, "islpddr": False},
+    "58M": {"type": "GDDR5X", "voltage": "1.25", "vtokenlength": 1, "islpddr": False},
+    "60B": {"type": "DDR5 SDRAM", "voltage": "1.1", "vtokenlength": 1, "islpddr": False},
+    "61A": {"type": "GDDR6", "voltage": "1.2", "vtokenlength": 1, "islpddr": False},
+    "61K": {"type": "GDDR6", "voltage": "1.35", "vtokenlength": 1, "islpddr": False},
+    "61K": {"type": "GDDR6X", "voltage": "1.35", "vtokenlength": 1, "islpddr": False},
+    "61M": {"type": "GDDR6", "voltage": "1.25", "vtokenlength": 1, "islpddr": False},
+    "61M": {"type": "GDDR6X", "voltage": "1.25", "vtokenlength": 1, "islpddr": False},
+    "62F": {"type": "LPDDR5 Mobile", "voltage": "1.05", "vtokenlength": 1, "islpddr": True},
+    "62F": {"type": "LPDDR5X Mobile", "voltage": "1.05", "vtokenlength": 1, "islpddr": True},
+    "68A": {"type": "GDDR7", "voltage": "1.2", "vtokenlength": 1, "islpddr": False},
+    "68B": {"type": "GDDR7", "voltage": "1.1", "vtokenlength": 1, "islpddr": False},
+}
+
+week_dict = {
+    "A": 2,
+    "B": 4,
+    "C": 6,
+    "D": 8,
+    "E": 10,
+    "F": 12,
+    "G": 14,
+    "H": 16,
+    "I": 18,
+    "J": 20,
+    "K": 22,
+    "L": 24,
+    "M": 26,
+    "N": 28,
+    "O": 30,
+    "P": 32,
+    "Q": 34,
+    "R": 36,
+    "S": 38,
+    "T": 40,
+    "U": 42,
+    "V": 44,
+    "W": 46,
+    "X": 48,
+    "Y": 50,
+    "Z": 52
+}
+
+location_dict = {
+    "1": "USA",
+    "2": "Singapore",
+    "3": "Italy",
+    "4": "Japan",
+    "5": "China",
+    "7": "Taiwan",
+    "8": "Korea",
+    "9": "Mixed",
+    "B": "Israel",
+    "C": "Ireland",
+    "D": "Malaysia",
+    "F": "Philippines"
+}
+
+depths = {
+    "1K": 1 * 1024,
+    "2K": 2 * 1024,
+    "4K": 4 * 1024,
+    "8K": 8 * 1024,
+    "16K": 16 * 1024,
+    "32K": 32 * 1024,
+    "64K": 64 * 1024,
+    "128K": 128 * 1024,
+    "256K": 256 * 1024,
+    "512K": 512 * 1024,
+    "1M": 1 * 1024 * 1024,
+    "2M": 2 * 1024 * 1024,
+    "4M": 4 * 1024 * 1024,
+    "8M": 8 * 1024 * 1024,
+    "16M": 16 * 1024 * 1024,
+    "32M": 32 * 1024 * 1024,
+    "64M": 64 * 1024 * 1024,
+    "128M": 128 * 1024 * 1024,
+    "256M": 256 * 1024 * 1024,
+    "512M": 512 * 1024 * 1024,
+    "1G": 1 * 1024 * 1024 * 1024,
+    "2G": 2 * 1024 * 1024 * 1024,
+    "4G": 4 * 1024 * 1024 * 1024,
+    "8G": 8 * 1024 * 1024 * 1024,
+    "16G": 16 * 1024 * 1024 * 1024,
+    "24G": 24 * 1024 * 1024 * 1024,
+    "32G": 32 * 1024 * 1024 * 1024,
+    "48G": 48 * 1024 * 1024 * 1024,
+    "64G": 64 * 1024 * 1024 * 1024,
+    "128G": 128 * 1024 * 1024 * 1024,
+    "256G": 256 * 1024 * 1024 * 1024,
+    "512G": 512 * 1024 * 1024 * 1024,
+}
+
+# It is important to have the list in this order because of the use of startswith(). For example: 128M16 could be selected with .startswith("128M1").
+widths = [
+    "32",
+    "16",
+    "9",
+    "8",
+    "4",
+    "2",
+    "1"
+]
+
+# Flash part number prefixes. NOR densities are in Mbit, or Gbit with a "G" suffix.
+flash_types_dict = {
+    "MT29F": {"type": "NAND Flash", "voltage": None, "family": "nand"},
+    "MT25QL": {"type": "Serial NOR Flash", "voltage": "3.0", "family": "nor"},
+    "MT25QU": {"type": "Serial NOR Flash", "voltage": "1.8", "family": "nor"},
+    "MT35XL": {"type": "Octal NOR Flash", "voltage": "3.0", "family": "nor"},
+    "MT35XU": {"type": "Octal NOR Flash", "voltage": "1.8", "family": "nor"},
+    "MT28EW": {"type": "Parallel NOR Flash", "voltage": "3.0", "family": "nor"},
+}
+
+# Elpida (legacy) part number prefixes
+elpida_types_dict = {
+    "EDS": {"type": "SDR SDRAM"},
+    "EDD": {"type": "DDR1 SDRAM"},
+    "EDE": {"type": "DDR2 SDRAM"},
+    "EDJ": {"type": "DDR3 SDRAM"},
+    "EDB": {"type": "LPDDR2 Mobile"},
+    "EDF": {"type": "LPDDR3 Mobile"},
+    "EDW": {"type": "GDDR5"},
+}
+
+# First two digits of the Elpida density code, the two after them are the organization such as "16" for x16
+elpida_densities = {
+    "64": 64 * 1024 * 1024,
+    "12": 128 * 1024 * 1024,
+    "25": 256 * 1024 * 1024,
+    "51": 512 * 1024 * 1024,
+    "10": 1 * 1024 * 1024 * 1024,
+    "11": 1 * 1024 * 1024 * 1024,
+    "20": 2 * 1024 * 1024 * 1024,
+    "21": 2 * 1024 * 1024 * 1024,
+    "40": 4 * 1024 * 1024 * 1024,
+    "42": 4 * 1024 * 1024 * 1024,
+    "80": 8 * 1024 * 1024 * 1024,
+    "81": 8 * 1024 * 1024 * 1024,
+}
+
+# Everything below is built once at import so devinfo() only walks the part number once. The depth alternatives all end in a letter so they can not shadow each other, the widths are in the same order as in "widths".
+dram_density_re = re.compile("(" + "|".join(depths.keys()) + ")(" + "|".join(widths) + ")")
+nand_density_re = re.compile(r"(\d+)([GT])(\d{2})")
+nor_density_re = re.compile(r"(\d{2}G|\d{3})")
+elpida_density_re = re.compile(r"(\d{2})\d{2}")
+
+# Prefix trie of every known part number prefix. Each node is a dict of the next character, the None key holds the device family of a prefix that ends there.
+def _buildtrie():
+    prefixes = {}
+
+    for key, value in dram_types_dict.items():
+        # If the Voltage Mark Token is either 1 or 2 letters
+        prefixes["MT" + key] = {"family": "dram", "type": value["type"], "voltage": value["voltage"], "skip": 4 + value["vtokenlength"]}
+
+    for key, value in flash_types_dict.items():
+        prefixes[key] = {"family": value["family"], "type": value["type"], "voltage": value["voltage"], "skip": len(key)}
+
+    for key, value in elpida_types_dict.items():
+        prefixes[key] = {"family": "elpida", "type": value["type"], "voltage": None, "skip": len(key)}
+
+    trie = {}
+    for prefix, family in prefixes.items():
+        node = trie
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node[None] = family
+
+    return trie
+
+part_trie = _buildtrie()
+
+# Density of a part number with its prefix removed, in the same format as before
+def _density(family, pn):
+    if family == "dram":
+        match = dram_density_re.match(pn)
+        if match:
+            return hsize(depths[match.group(1)] * int(match.group(2)))
+    elif family == "nand":
+        match = nand_density_re.match(pn)
+        if match:
+            if match.group(2) == "T":
+                return hsize(int(match.group(1)) * 1024 ** 4)
+            else:
+                return hsize(int(match.group(1)) * 1024 ** 3)
+    elif family == "nor":
+        match = nor_density_re.match(pn)
+        if match:
+            size = match.group(1)
+            if size.endswith("G"):
+                return hsize(int(size[:-1]) * 1024 ** 3)
+            else:
+                return hsize(int(size) * 1024 ** 2)
+    elif family == "elpida":
+        match = elpida_density_re.match(pn)
+        if match and match.group(1) in elpida_densities:
+            return hsize(elpida_densities[match.group(1)])
+
+    return None
+
+def devinfo(pn):
+    # Walk the trie for the longest known prefix
+    node = part_trie
+    device = None
+    for char in pn:
+        node = node.get(char)
+        if node is None:
+            break
+        if None in node:
+            device = node[None]
+
+    if not device:
+        return False
+
+    dierev = None
+    # This seems to be consistent across product types (DRAM, flash, etc.)
+    if pn[-2:-1] == ":":
+        dierev = pn[-1]
+
+    density = _density(device["family"], pn[device["skip"]:])
+
+    return {"devtype": device["type"], "density": density, "devvoltage": device["voltage"], "dierev": dierev}
+
+# Production codes (see Micron CSN-11) are decoded by looking each character up in the table for its position, a code with a character missing from its table is not valid. The year digit table depends on the current year so it is built once per year.
+@lru_cache(maxsize = 1)
+def prodcodetables(year):
+    # The first character is the last digit of the year, which does not really give a specific year
+    years = {str(digit): tuple(y for y in range(1990 + digit, year + 1, 10)) for digit in range(10)}
+    years = {digit: y for digit, y in years.items() if y}
+    weeks = {letter: (week - 1, week) for letter, week in week_dict.items()}
+    dierevs = {letter: letter for letter in "ABCDEFGHIJKLMNOPQRSTUVWXYZ"}
+
+    return (years, weeks, dierevs, location_dict, location_dict)
+
+# Decode a production code (top row on the IC). Returns a dict of the possible production years, the week range, die revision and the diffusion and packaging locations, or None if the code is not valid.
+def decodeprodcode(code, tables = None):
+    if tables is None:
+        tables = prodcodetables(datetime.now().year)
+
+    if len(code) != 5:
+        return None
+
+    code = code.upper()
+    try:
+        years, weeks, dierev, diffused, packaged = [table[char] for table, char in zip(tables, code)]
+    except KeyError:
+        return None
+
+    return {"years": years, "weeks": weeks, "dierev": dierev, "diffused": diffused, "packaged": packaged}
+
+# Decode a list of production codes at once. Returns a dict of code to the result of decodeprodcode() in the order given.
+def decodeprodcodes(codes):
+    tables = prodcodetables(datetime.now().year)
+
+    return {code: decodeprodcode(code, tables) for code in codes}
+
+# Streaming parser for the FBGA lookup page that only keeps the text of the first table cell and stops once the cell is closed
+class FirstCellParser(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.depth = 0
+        self.parts = []
+        self.found = False
+        self.done = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "td" and not self.done:
+            self.depth += 1
+            self.found = True
+
+    def handle_endtag(self, tag):
+        if tag == "td" and self.depth:
+            self.depth -= 1
+            if not self.depth:
+                self.done = True
+
+    def handle_data(self, data):
+        if self.depth and not self.done:
+            self.parts.append(data)
+
+# Text of the first <td> in a page or None if there is none, the same result as BeautifulSoup(text).find("td").text. The page is fed in chunks so the rest of it is not parsed once the cell has been found.
+def firstcell(text, chunksize = 8192):
+    # A page without a cell, which is what an unknown code gives, can be answered without parsing it at all
+    if "<td" not in text.lower():
+        return None
+
+    parser = FirstCellParser()
+    try:
+        for i in range(0, len(text), chunksize):
+            parser.feed(text[i:i + chunksize])
+            if parser.done:
+                break
+        parser.close()
+    except Exception as err:
+        cog_logger.warning(f"Falling back to BeautifulSoup to parse the FBGA lookup page: {err!r}")
+        from bs4 import BeautifulSoup
+
+        pnc = BeautifulSoup(text, 'html.parser').find('td')
+        return pnc.text if pnc else None
+
+    if not parser.found:
+        return None
+
+    return "".join(parser.parts)
+
+class FBGAError(Exception):
+    pass
+
+# Whether a cached lookup result can still be used
+def isfresh(pn, timestamp):
+    if pn == "None":
+        ttl = config.negative_ttl
+    else:
+        ttl = config.positive_ttl
+
+    return ttl == 0 or time() - timestamp < ttl * 86400
+
+# FBGA code lookups against the knowncodes cache and the Micron website
+class FBGALookup:
+    def __init__(self):
+        self.session = None
+        # FBGA code to the request currently fetching it, concurrent lookups of the same code share it
+        self.inflight = {}
+        # FBGA code to (part number, timestamp)
+        self.cache = LRUCache(config.lru_size)
+
+    async def warm(self):
+        res = await knowncodesdb.fetchall("SELECT fbga, partnumber, timestamp FROM knowncodes ORDER BY lastused DESC LIMIT ?", (self.cache.size,))
+
+        # Oldest first, so the most recently used end up at the fresh end of the LRU
+        for code, pn, timestamp in reversed(res):
+            self.cache.put(code, (pn, timestamp))
+
+        cog_logger.info(f"Loaded {len(res)} FBGA codes into memory")
+
+    def flush(self, code):
+        self.cache.pop(code)
+
+    # One session for every lookup, so the connections to the Micron website are reused instead of paying for DNS, TCP and TLS each time
+    def getsession(self):
+        if not self.session or self.session.closed:
+            connector = aiohttp.TCPConnector(limit_per_host = config.http_limit_per_host, keepalive_timeout = config.http_keepalive)
+            timeout = aiohttp.ClientTimeout(total = config.http_timeout)
+            self.session = aiohttp.ClientSession(connector = connector, timeout = timeout)
+
+        return self.session
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+
+    async def fetch(self, code):
+        try:
+            async with self.getsession().get(micron_url, params = {"fbga": code}) as response:
+                status = response.status
+                text = await response.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            cog_logger.error(f"Request for FBGA code {code} failed: {err!r}")
+            raise FBGAError("Request to the Micron website failed")
+
+        if status != 200:
+            raise FBGAError(f"HTTP error: {status}")
+
+        # Parsed off the event loop so a large page does not hold up the bot
+        pn = await asyncio.to_thread(firstcell, text)
+        if pn is not None:
+            cog_logger.info(f"Known valid FBGA code inserted into database: {code}")
+        else:
+            cog_logger.info(f"Known invalid FBGA code inserted into database: {code}")
+            pn = "None"
+
+        timestamp = time()
+        await knowncodesdb.execute("INSERT OR REPLACE INTO knowncodes VALUES(?, ?, ?, ?)", (code, pn, timestamp, timestamp))
+        self.cache.put(code, (pn, timestamp))
+
+        return pn
+
+    # Returns the part number, "None" if the code is not valid, and whether the result came from the cache. Raises FBGAError if the Micron website could not be reached.
+    async def lookup(self, code):
+        res = self.cache.get(code)
+        if not res:
+            res = await knowncodesdb.fetchone("SELECT partnumber, timestamp FROM knowncodes WHERE fbga=?", (code,))
+            if res:
+                self.cache.put(code, res)
+
+        if (self.cache.hits + self.cache.misses) % 100 == 0:
+            cog_logger.info(f"FBGA code memory cache: {self.cache.stats()}")
+
+        if res and isfresh(res[0], res[1]):
+            cog_logger.info(f"FBGA code found in cache: {code}")
+            lastusedwriter.put(knowncodesdb.path, "UPDATE knowncodes SET lastused = ? WHERE fbga = ?", (time(), code))
+            return res[0], True
+
+        return await self.fetchshared(code), False
+
+    async def fetchshared(self, code):
+        task = self.inflight.get(code)
+        if task:
+            cog_logger.info(f"FBGA code lookup already in progress: {code}")
+        else:
+            task = asyncio.ensure_future(self.fetch(code))
+            self.inflight[code] = task
+            task.add_done_callback(lambda t: self.inflight.pop(code, None))
+
+        # Shielded so one user giving up does not cancel the request for everyone else waiting on it
+        return await asyncio.shield(task)
+
+    # Look up a list of codes. Codes in memory or in the database are resolved with one query, the rest are fetched concurrently with at most bulk_concurrency requests at once. Returns a dict of code to (part number, cached), or to an FBGAError for codes that could not be looked up.
+    async def lookupmany(self, codes):
+        results = {}
+        missing = []
+
+        for code in dict.fromkeys(codes):
+            res = self.cache.get(code)
+            if res and isfresh(res[0], res[1]):
+                results[code] = (res[0], True)
+            else:
+                missing.append(code)
+
+        # SQLite has a limit on the number of parameters
+        for i in range(0, len(missing), 500):
+            chunk = missing[i:i + 500]
+            placeholders = ", ".join(["?"] * len(chunk))
+            for code, pn, timestamp in await knowncodesdb.fetchall(f"SELECT fbga, partnumber, timestamp FROM knowncodes WHERE fbga IN ({placeholders})", chunk):
+                self.cache.put(code, (pn, timestamp))
+                if isfresh(pn, timestamp):
+                    results[code] = (pn, True)
+
+        now = time()
+        for code in results:
+            lastusedwriter.put(knowncodesdb.path, "UPDATE knowncodes SET lastused = ? WHERE fbga = ?", (now, code))
+
+        semaphore = asyncio.Semaphore(config.bulk_concurrency)
+
+        async def fetchone(code):
+            async with semaphore:
+                try:
+                    results[code] = (await self.fetchshared(code), False)
+                except FBGAError as err:
+                    results[code] = err
+
+        await asyncio.gather(*[fetchone(code) for code in missing if code not in results])
+
+        cog_logger.info(f"Bulk lookup of {len(results)} FBGA codes, {len(missing)} not in memory. Memory cache: {self.cache.stats()}")
+
+        return {code: results[code] for code in dict.fromkeys(codes)}
+
+# Split text such as a message or a text file into FBGA codes. Returns the valid codes and anything that is not one.
+def parsecodes(text):
+    codes = []
+    invalid = []
+    for token in re.split(r"[\s,;]+", text.upper()):
+        if not token:
+            continue
+        elif re.fullmatch("[A-Z0-9]{5}", token):
+            codes.append(token)
+        else:
+            invalid.append(token)
+
+    return codes, invalid
+
+# Lines reporting the tokens parsecodes() could not use. Only the first few are listed and long ones are cut short, a file of junk or a single long line would otherwise not fit in a message.
+def invalidlines(tokens, kind, maxtokens = 20, maxchars = 32):
+    lines = []
+    for token in tokens[:maxtokens]:
+        if len(token) > maxchars:
+            token = token[:maxchars] + "..."
+        # Backticks would end the code span early
+        token = token.replace("`", "'")
+        lines.append(f"`{token}`: Invalid {kind}")
+
+    if len(tokens) > maxtokens:
+        lines.append(f"... and {len(tokens) - maxtokens} more invalid entries")
+
+    return lines
+
+# Read a dump of FBGA codes and part numbers. JSON can be a list of {"fbga": ..., "partnumber": ...} objects or an object of code to part number, CSV is "fbga,partnumber" rows with an optional header. Returns the (fbga, partnumber) pairs and the number of entries that were skipped.
+def parsedataset(text, filename):
+    pairs = []
+    skipped = 0
+
+    if filename.lower().endswith(".json"):
+        data = json.loads(text)
+        if isinstance(data, dict):
+            rows = list(data.items())
+        elif isinstance(data, list):
+            # Entries that are not objects are counted as skipped below
+            rows = [(row.get("fbga"), row.get("partnumber")) if isinstance(row, dict) else () for row in data]
+        else:
+            raise ValueError("expected a list of objects or an object of FBGA code to part number")
+    else:
+        rows = [row for row in csv.reader(io.StringIO(text)) if row]
+        if rows and rows[0][0].strip().lower() == "fbga":
+            rows = rows[1:]
+
+    for row in rows:
+        if len(row) < 2 or not isinstance(row[0], str) or not isinstance(row[1], str):
+            skipped += 1
+            continue
+
+        code = row[0].strip().upper()
+        pn = row[1].strip()
+        if re.fullmatch("[A-Z0-9]{5}", code) and pn:
+            pairs.append((code, pn))
+        else:
+            skipped += 1
+
+    return pairs, skipped
+
+# Write FBGA codes into knowncodes in a single transaction. Existing codes are kept unless "overwrite" is set. Returns the number of codes written.
+async def importcodes(pairs, overwrite = False):
+    timestamp = time()
+
+    if overwrite:
+        sql = "INSERT OR REPLACE INTO knowncodes VALUES(?, ?, ?, ?)"
+    else:
+        sql = "INSERT OR IGNORE INTO knowncodes VALUES(?, ?, ?, ?)"
+
+    count = await knowncodesdb.executemany(sql, [(code, pn, timestamp, 0) for code, pn in pairs])
+
+    # Refresh the query planner statistics after a large import
+    await knowncodesdb.executescript("PRAGMA optimize;")
+
+    cog_logger.info(f"Imported {count} of {len(pairs)} FBGA codes")
+
+    return count
+
+# Every known FBGA code as CSV or JSON text, codes without a part number are left out unless "invalid" is set
+async def exportcodes(fmt, invalid = False):
+    if invalid:
+        rows = await knowncodesdb.fetchall("SELECT fbga, partnumber FROM knowncodes ORDER BY fbga")
+    else:
+        rows = await knowncodesdb.fetchall("SELECT fbga, partnumber FROM knowncodes WHERE partnumber != 'None' ORDER BY fbga")
+
+    if fmt == "json":
+        return json.dumps([{"fbga": code, "partnumber": pn} for code, pn in rows], indent = 1), len(rows)
+
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["fbga", "partnumber"])
+    writer.writerows(rows)
+
+    return out.getvalue(), len(rows)
+
+# Look up FBGA codes without the bot, such as from a script or the Python shell: asyncio.run(fbgabulk(["D9PSK"]))
+async def fbgabulk(codes):
+    await asyncio.to_thread(createdb)
+
+    fbgalookup = FBGALookup()
+    try:
+        return await fbgalookup.lookupmany(codes)
+    finally:
+        await fbgalookup.close()
+        lastusedwriter.stop()
+
+class Micron(Cog):
+    def __init__(self, client):
+        self.client = client
+        self.fbgalookup = FBGALookup()
+
+    def cog_unload(self):
+        lastusedwriter.stop()
+        cog_logger.info(f"FBGA code memory cache: {self.fbgalookup.cache.stats()}")
+
+        # app.py unloads the cogs before the loop is closed and waits for this
+        try:
+            asyncio.get_running_loop().create_task(self.fbgalookup.close())
+        except RuntimeError:
+            # Unloaded without a running loop, the session has nothing left to close on
+            pass
+
+    micron = SlashCommandGroup("micron", "Commands for decoding and searching Micron Technology device markings")
+
+    @micron.command(name = "fbga", description = "Micron FBGA Lookup - Search for a FBGA code (bottom row on IC)")
+    async def micron_fbga(self, ctx: discord.ApplicationContext, code: discord.Option(str, "FBGA code - not case sensitive", min_length = 5, max_length = 5, required = True)):
+        code = code.upper()
+
+        if not re.match("[A-Z0-9]+", code):
+            await ctx.respond(embed = mkerrembed(f"Invalid FBGA code"))
+            return
+
+        try:
+            pn, cached = await self.fbgalookup.lookup(code)
+        except FBGAError as err:
+            await ctx.respond(embed = mkerrembed(str(err)))
+            return
+
+        timestamp = datetime.now().strftime("%b %-d, %Y, %H:%M %Z")
+
+        cog_logger.info(f"Part number: {pn}")
+
+        if pn == "None":
+            embed = discord.Embed(title = f"No part number found for {code}", color = 0xbd03f7)
+
+            if cached:
+                embed.set_footer(text = f"Cached - {timestamp}")
+            else:
+                embed.set_footer(text = f"{micron_url}?fbga={code} - {timestamp}")
+
+            await ctx.respond(embed = embed)
+            return
+        else:
+            embed = discord.Embed(title = f"Results for {code}", color = 0xbd03f7)
+
+        if pn.startswith("HYB"):
+            # It is highly unlikely that a code would resolve to an Infineon/Qimonda part but it is here just in case
+            embed.add_field(name = "Part Number - Qimonda legacy part", value = pn, inline = False)
+        else:
+            if pn.startswith("E"):
+                embed.add_field(name = "Part Number - Elpida legacy part", value = pn, inline = False)
+            else:
+                embed.add_field(name = "Part Number", value = pn, inline = False)
+
+            devinfodict = devinfo(pn)
+            if devinfodict:
+                if devinfodict["devtype"]:
+                    embed.add_field(name = "Type", value = devinfodict["devtype"], inline = False)
+                if devinfodict["density"]:
+                    embed.add_field(name = "Density", value = devinfodict["density"], inline = False)
+                if devinfodict["devvoltage"]:
+                    embed.add_field(name = "Voltage", value = devinfodict["devvoltage"], inline = False)
+                if devinfodict["dierev"]:
+                    embed.add_field(name = "Die Revision", value = devinfodict["dierev"], inline = False)
+
+        if cached:
+            embed.set_footer(text = f"Cached - {timestamp}")
+        else:
+            embed.set_footer(text = f"{micron_url}?fbga={code} - {timestamp}")
+
+        await ctx.respond(embed = embed)
+        return
+
+    @micron.command(name = "bulk", description = "Micron FBGA Lookup - Search for many FBGA codes at once")
+    async def micron_fbga_bulk(self, ctx: discord.ApplicationContext,
+        codes: discord.Option(str, "FBGA codes separated by spaces or commas", required = False),
+        file: discord.Option(discord.Attachment, "Text file of FBGA codes", required = False)):
+
+        text = codes or ""
+        if file:
+            text += "\n" + (await file.read()).decode(errors = "replace")
+
+        codes, invalid = parsecodes(text)
+        if not codes:
+            await ctx.respond(embed = mkerrembed("No valid FBGA codes given"))
+            return
+
+        if len(codes) > config.bulk_max:
+            await ctx.respond(embed = mkerrembed(f"Too many FBGA codes, at most {config.bulk_max} can be looked up at once"))
+            return
+
+        await ctx.defer()
+
+        results = await self.fbgalookup.lookupmany(codes)
+
+        lines = [f"# Results for {len(results)} FBGA codes"]
+        for code, result in results.items():
+            if isinstance(result, FBGAError):
+                lines.append(f"`{code}`: Error - {result}")
+            elif result[0] == "None":
+                lines.append(f"`{code}`: No part number found")
+            else:
+                lines.append(f"`{code}`: {result[0]}")
+
+        lines += invalidlines(invalid, "FBGA code")
+
+        for part in msgsplit(1900, lines):
+            await ctx.respond(part)
+
+    @micron.command(name = "import", description = "Micron FBGA Lookup - Import FBGA codes from a CSV or JSON file")
+    @default_permissions(administrator = True)
+    async def micron_import(self, ctx: discord.ApplicationContext,
+        file: discord.Option(discord.Attachment, "CSV (fbga,partnumber) or JSON file", required = True),
+        overwrite: discord.Option(bool, "Replace codes that are already known - defaults to False", required = False)):
+
+        await ctx.defer()
+
+        try:
+            pairs, skipped = parsedataset((await file.read()).decode(errors = "replace"), file.filename)
+        except ValueError as err:
+            await ctx.respond(embed = mkerrembed(f"Could not read {file.filename}: {err}"))
+            return
+
+        count = await importcodes(pairs, overwrite = bool(overwrite))
+
+        for code, pn in pairs:
+            self.fbgalookup.flush(code)
+
+        await ctx.respond(f"Imported {count} FBGA codes, {len(pairs) - count} already known, {skipped} invalid entries skipped")
+
+    @micron.command(name = "export", description = "Micron FBGA Lookup - Export all known FBGA codes")
+    @default_permissions(administrator = True)
+    async def micron_export(self, ctx: discord.ApplicationContext,
+        fmt: discord.Option(str, "File format - defaults to csv", name = "format", choices = ["csv", "json"], required = False),
+        invalid: discord.Option(bool, "Include codes that have no part number - defaults to False", required = False)):
+
+        if not fmt:
+            fmt = "csv"
+
+        await ctx.defer()
+
+        text, count = await exportcodes(fmt, invalid = bool(invalid))
+
+        await ctx.respond(f"{count} FBGA codes", file = discord.File(io.BytesIO(text.encode()), filename = f"knowncodes.{fmt}"))
+
+    @micron.command(name = "flush", description = "Micron FBGA Lookup - Removes a specific FBGA code from the database")
+    async def micron_flush_fbga(self, ctx: discord.ApplicationContext, code: discord.Option(str, "FBGA code - not case sensitive", min_length = 5, max_length = 5, required = True)):
+        code = code.upper()
+
+        self.fbgalookup.flush(code)
+
+        if await knowncodesdb.execute("DELETE FROM knowncodes WHERE fbga=?", (code,)):
+            embed = discord.Embed(title = f"{code} removed from database", color = 0xbd03f7)
+            cog_logger.info(f"FBGA code removed from database: {code}")
+            await ctx.respond(embed = embed)
+            return
+        else:
+            await ctx.respond(embed = mkerrembed("FGBA code not found in database"))
+            return
+
+    @micron.command(name = "prod", description = "Micron FBGA Lookup - Decode production code (top row on IC)")
+    async def micron_prod_code(self, ctx: discord.ApplicationContext, code: discord.Option(str, "Production code - not case sensitive", min_length = 5, max_length = 5, required = True)):
+        code = code.upper()
+
+        info = decodeprodcode(code)
+        if not info:
+            await ctx.respond(embed = mkerrembed(f"Invalid production code"))
+            return
+
+        embed = discord.Embed(title = f"Results for {code}", color = 0x0000FF)
+        embed.add_field(name = "Production year", value = ", ".join(str(year) for year in info["years"]), inline = False)
+        embed.add_field(name = "Production week range", value = f"Week {info['weeks'][0]} - Week {info['weeks'][1]}", inline = False)
+        embed.add_field(name = "Die revision", value = info["dierev"], inline = False)
+        embed.add_field(name = "Diffused", value = info["diffused"], inline = False)
+        embed.add_field(name = "Packaged", value = info["packaged"], inline = False)
+
+        await ctx.respond(embed = embed)
+        return
+
+    @micron.command(name = "prodbulk", description = "Micron FBGA Lookup - Decode many production codes at once")
+    async def micron_prod_bulk(self, ctx: discord.ApplicationContext,
+        codes: discord.Option(str, "Production codes separated by spaces or commas", required = False),
+        file: discord.Option(discord.Attachment, "Text file of production codes", required = False)):
+
+        text = codes or ""
+        if file:
+            text += "\n" + (await file.read()).decode(errors = "replace")
+
+        # Production codes are five characters like FBGA codes, anything else is reported as invalid
+        codes, invalid = parsecodes(text)
+        if not codes and not invalid:
+            await ctx.respond(embed = mkerrembed("No production codes given"))
+            return
+
+        if len(codes) > config.bulk_max:
+            await ctx.respond(embed = mkerrembed(f"Too many production codes, at most {config.bulk_max} can be decoded at once"))
+            return
+
+        lines = [f"# Results for {len(codes) + len(invalid)} production codes"]
+        for code, info in decodeprodcodes(codes).items():
+            if info:
+                years = ", ".join(str(year) for year in info["years"])
+                lines.append(f"`{code}`: {years}, week {info['weeks'][0]} - {info['weeks'][1]}, die rev. {info['dierev']}, diffused in {info['diffused']}, packaged in {info['packaged']}")
+            else:
+                lines.append(f"`{code}`: Invalid production code")
+
+        lines += invalidlines(invalid, "production code")
+
+        for part in msgsplit(1900, lines):
+            await ctx.respond(part)
+
+# Create or upgrade knowncodes.db
+def createdb():
+    os.makedirs("data/micron/", exist_ok = True)
+
+    # Init database if it does not exist
+    if not os.path.exists("data/micron/knowncodes.db"):
+        dbc = sqlite3.connect("data/micron/knowncodes.db")
+        cur = dbc.cursor()
+
+        with open("cogs/micron/knowncodes.sql") as f:
+            sql = f.read()
+
+        cur.executescript(sql)
+        dbc.commit()
+        dbc.close()
+    else:
+        dbc = sqlite3.connect("data/micron/knowncodes.db")
+        cur = dbc.cursor()
+
+        # Databases from before lookup results expired have no timestamps and may have duplicate codes
+        columns = [row[1] for row in cur.execute("PRAGMA table_info(knowncodes)")]
+        if "timestamp" not in columns:
+            cog_logger.info("Adding timestamps and a unique key to knowncodes")
+            cur.execute("ALTER TABLE knowncodes ADD COLUMN timestamp REAL")
+            cur.execute("UPDATE knowncodes SET timestamp = ?", (time(),))
+            cur.execute("DELETE FROM knowncodes WHERE rowid NOT IN (SELECT MAX(rowid) FROM knowncodes GROUP BY fbga)")
+            cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS knowncodes_fbga ON knowncodes (fbga)")
+
+        if "lastused" not in columns:
+            cur.execute("ALTER TABLE knowncodes ADD COLUMN lastused REAL")
+            cur.execute("UPDATE knowncodes SET lastused = timestamp")
+            cur.execute("CREATE INDEX IF NOT EXISTS knowncodes_lastused ON knowncodes (lastused)")
+
+        cur.execute("CREATE INDEX IF NOT EXISTS knowncodes_partnumber ON knowncodes (partnumber)")
+
+        dbc.commit()
+        dbc.close()
+
+async def warmup(client):
+    await asyncio.to_thread(createdb)
+
+    cog = client.get_cog("Micron")
+    if cog:
+        await cog.fbgalookup.warm()
+
+def setup(client):
+    client.add_cog(Micron(client))
@@ -0,0 +1,10 @@
+CREATE TABLE knowncodes (
+    fbga varchar(5) PRIMARY KEY,
+    partnumber varchar(64),
+    timestamp REAL,
+    lastused REAL
+);
+
+CREATE INDEX knowncodes_lastused ON knowncodes (lastused);
+
+CREATE INDEX knowncodes_partnumber ON knowncodes (partnumber);
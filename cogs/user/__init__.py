@@ -0,0 +1,1080 @@
+# SLAG - CTCL 2024
+# File: cogs/user/__init__.py
+# Purpose: User profiling and birthday reminder extension
+# Created: January 27, 2024
+# Modified: October 18, 2026
+
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+from datetime import datetime, time, timezone
+from collections import Counter, OrderedDict
+from time import monotonic, perf_counter
+
+import discord
+from discord import default_permissions
+from discord.errors import Forbidden, HTTPException, NotFound
+from discord.ext import tasks
+from discord.ext.commands import Cog
+from discord.ext.commands.errors import MemberNotFound
+from discord.commands import SlashCommandGroup
+from pydantic import BaseModel, NonNegativeFloat, PositiveFloat, PositiveInt
+from typing import Literal
+
+from lib import BatchWriter, dbcall, dbforget, eventlog, getdb, logger_setup, metrics, mkerrembed
+
+sys_logger = logging.getLogger("sys_logger")
+
+if not os.path.exists("log/"):
+    os.mkdir("log/")
+
+cog_logger = logger_setup("user_logger", "log/user.log", level=logging.DEBUG)
+
+class UserConfig(BaseModel):
+    # Messages are written to the user databases in batches, once this many are queued or after this many seconds
+    msgqueue_size: PositiveInt = 500
+    msgqueue_interval: PositiveFloat = 5.0
+    # "sharded" keeps the data of all users in a fixed number of databases, "peruser" keeps the legacy layout of one database per user
+    storage: Literal["sharded", "peruser"] = "sharded"
+    shards: PositiveInt = 1
+    # Presence changes of a user that arrive within this many seconds of each other are written as one row
+    presence_window: NonNegativeFloat = 10.0
+    # Minutes between logging the presence update counters
+    presence_stats_interval: PositiveFloat = 60.0
+    # Messages of history read before each write and checkpoint, and channels read at once
+    backfill_batch: PositiveInt = 500
+    backfill_concurrency: PositiveInt = 4
+    # Recent messages whose author is kept in memory, older ones are looked up in msgindex.db
+    msgindex_cache: PositiveInt = 10000
+
+with open("cogs/user/config.json") as f:
+    config_raw = f.read()
+
+config = UserConfig(**json.loads(config_raw))
+
+monthdict = {
+    "january": {"num": 1, "days": 31},
+    "february": {"num": 2, "days": 29},
+    "march": {"num": 3, "days": 31},
+    "april": {"num": 4, "days": 30},
+    "may": {"num": 5, "days": 31},
+    "june": {"num": 6, "days": 30},
+    "july": {"num": 7, "days": 31},
+    "august": {"num": 8, "days": 31},
+    "september": {"num": 9, "days": 30},
+    "october": {"num": 10, "days": 31},
+    "november": {"num": 11, "days": 30},
+    "december": {"num": 12, "days": 31}
+}
+
+onlinestatus = {
+    "offline": 0,
+    "online": 1,
+    "idle": 2,
+    "dnd": 3
+}
+
+# Where the messages and activity of a user are stored, depending on the "storage" setting
+class UserStore:
+    def __init__(self, storage, shards):
+        self.peruser = storage == "peruser"
+        self.shards = shards
+
+    def path(self, userid):
+        if self.peruser:
+            return f"data/user/user_{userid}.db"
+        elif self.shards == 1:
+            return "data/user/userdata.db"
+        else:
+            return f"data/user/userdata_{userid % self.shards}.db"
+
+    # All shard files, empty for per-user storage
+    def shardpaths(self):
+        if self.peruser:
+            return []
+
+        return sorted(set(self.path(i) for i in range(self.shards)))
+
+    # Statement and parameters that add a row to one of the user data tables
+    def insert(self, table, userid, values, ignore = False):
+        if not self.peruser:
+            values = (userid,) + values
+
+        placeholders = ", ".join(["?"] * len(values))
+        if ignore:
+            sql = f"INSERT OR IGNORE INTO {table} VALUES({placeholders})"
+        else:
+            sql = f"INSERT INTO {table} VALUES({placeholders})"
+
+        return self.path(userid), sql, values
+
+    # Statements that record an edit in messageedit, with the old content taken from usermessages, and then update the message. Edits that do not change the content, such as link embeds loading, are skipped.
+    def edit(self, userid, msgid, timestamp, content):
+        if self.peruser:
+            select = "SELECT ?, msgid, channelid, guildid, msgcontent, ?"
+        else:
+            select = "SELECT userid, ?, msgid, channelid, guildid, msgcontent, ?"
+
+        path = self.path(userid)
+
+        return [
+            (path, f"INSERT INTO messageedit {select} FROM usermessages WHERE msgid = ? AND msgcontent != ?", (timestamp, content, msgid, content)),
+            (path, "UPDATE usermessages SET msgcontent = ? WHERE msgid = ?", (content, msgid))
+        ]
+
+    # WHERE clause and parameters that limit a query to one user
+    def where(self, userid):
+        if self.peruser:
+            return "", ()
+
+        return " WHERE userid=?", (userid,)
+
+userstore = UserStore(config.storage, config.shards)
+
+# Discord sends a presence update for every guild shared with a user and many of them change nothing that useractivity records. This keeps the last written state of each user so those are dropped, and holds changes for "window" seconds so that flapping is written once.
+class PresenceTracker:
+    def __init__(self, window):
+        self.window = window
+        # User ID to the last written entry without its timestamp
+        self.last = {}
+        # User ID to (time first seen, latest entry)
+        self.pending = {}
+
+        self.received = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.written = 0
+
+    def update(self, userid, entry):
+        self.received += 1
+
+        if userid in self.pending:
+            first, oldentry = self.pending[userid]
+            self.pending[userid] = (first, entry)
+            self.coalesced += 1
+        elif self.last.get(userid) == entry[1:]:
+            self.dropped += 1
+        else:
+            self.pending[userid] = (monotonic(), entry)
+
+    # Entries that have waited out the window, or all of them if "everything" is set
+    def due(self, everything = False):
+        now = monotonic()
+        entries = []
+
+        for userid, (first, entry) in list(self.pending.items()):
+            if not everything and now - first < self.window:
+                continue
+
+            del self.pending[userid]
+
+            # Flapping may have ended where it started
+            if self.last.get(userid) == entry[1:]:
+                self.dropped += 1
+                continue
+
+            self.last[userid] = entry[1:]
+            self.written += 1
+            entries.append((userid, entry))
+
+        return entries
+
+    def stats(self):
+        return f"Presence updates: {self.received} received, {self.written} written, {self.dropped} dropped as unchanged, {self.coalesced} coalesced"
+
+presencetracker = PresenceTracker(config.presence_window)
+
+usermetadb = getdb("data/user/usermeta.db")
+guildmetadb = getdb("data/user/guildmeta.db")
+
+# Shared by every listener that logs messages, see BatchWriter in lib.py
+msgwriter = BatchWriter(maxsize = config.msgqueue_size, interval = config.msgqueue_interval)
+
+msgindexdb = getdb("data/user/msgindex.db")
+
+# Message ID to author, so deletes and edits never depend on the message cache of the bot
+class MessageIndex:
+    def __init__(self, size):
+        self.size = size
+        self.recent = OrderedDict()
+
+    def statement(self, msgid, userid, channelid, guildid):
+        return msgindexdb.path, "INSERT OR IGNORE INTO msgindex VALUES(?, ?, ?, ?)", (msgid, userid, channelid, guildid)
+
+    def add(self, msgid, userid, channelid, guildid):
+        self.recent[msgid] = userid
+        if len(self.recent) > self.size:
+            self.recent.popitem(last = False)
+
+        msgwriter.put(*self.statement(msgid, userid, channelid, guildid))
+
+    # Authors of a list of messages, messages that were never logged are left out
+    async def authors(self, msgids):
+        authors = {}
+        missing = []
+        for msgid in msgids:
+            if msgid in self.recent:
+                authors[msgid] = self.recent[msgid]
+            else:
+                missing.append(msgid)
+
+        # SQLite has a limit on the number of parameters, bulk deletes are at most 100 messages anyway
+        for i in range(0, len(missing), 500):
+            chunk = missing[i:i + 500]
+            placeholders = ", ".join(["?"] * len(chunk))
+            for msgid, userid in await msgindexdb.fetchall(f"SELECT msgid, userid FROM msgindex WHERE msgid IN ({placeholders})", chunk):
+                authors[msgid] = userid
+
+        return authors
+
+    # Databases that may have a message. Messages imported with /user migrate are not in the index, with shared storage those can still be found by trying every shard.
+    def paths(self, authors, msgid):
+        if msgid in authors:
+            return [userstore.path(authors[msgid])]
+        else:
+            return userstore.shardpaths()
+
+msgindex = MessageIndex(config.msgindex_cache)
+
+class User(Cog):
+    def __init__(self, client):
+        self.client = client
+        self.gathering = False
+
+    def cog_unload(self):
+        self.presence_flush.cancel()
+        self.presence_stats.cancel()
+        self.birthday_reminder.cancel()
+
+        # Write out any messages and activity that are still queued
+        try:
+            for userid, entry in presencetracker.due(everything = True):
+                msgwriter.put(*userstore.insert("useractivity", userid, entry))
+        finally:
+            msgwriter.stop()
+
+        cog_logger.info(presencetracker.stats())
+
+    birthday = SlashCommandGroup("birthday", "Birthday related commands")
+    user = SlashCommandGroup("user", "User info related commands")
+
+    @Cog.listener()
+    @metrics.timed("listener")
+    async def on_ready(self):
+        usercache.loadmembers(self.client)
+
+        await addguilds(self.client)
+
+        if not self.presence_flush.is_running():
+            self.presence_flush.start()
+            self.presence_stats.start()
+            self.birthday_reminder.start()
+
+        # In case users joined while SLAG is offline
+        await refreshusers(self.client)
+
+    @Cog.listener()
+    @metrics.timed("listener")
+    async def on_member_join(self, member):
+        usercache.invalidate(member.id)
+        await checkuserindb(self.client, member.id)
+
+    @Cog.listener()
+    @metrics.timed("listener")
+    async def on_member_remove(self, member):
+        usercache.invalidate(member.id)
+
+    @Cog.listener()
+    @metrics.timed("listener")
+    async def on_member_update(self, before, after):
+        usercache.invalidate(after.id)
+
+    @birthday.command(name = "set", description = "Set your birthday")
+    async def birthday_set(self, ctx: discord.ApplicationContext,
+        month: discord.Option(str, "Month of Birth", autocomplete = discord.utils.basic_autocomplete(monthdict.keys()), max_length = 9, required = True),
+        day: discord.Option(int, "Day of Birth", min_value = 1, max_value = 31, required = True),
+        year: discord.Option(int, "Year of Birth", min_value = 1900, max_value = (datetime.now().year - 13), required = False)):
+
+        if not month.lower() in monthdict.keys():
+            await ctx.respond(embed = mkerrembed(f"Invalid month: {month.lower()}"))
+            return
+
+        month = month.lower()
+
+        if day > monthdict[month]["days"]:
+            await ctx.respond(embed = mkerrembed(f"Invalid day parameter: {day}. Day of month must be between 1 and {monthdict[month]['days']}"))
+            return
+
+        month = monthdict[month]["num"]
+
+        userid = ctx.author.id
+
+        if not year:
+            year = 0
+
+        values = (year, month, day, userid)
+
+        await usermetadb.execute("UPDATE usermeta SET birthyear=?, birthmonth=?, birthday=? WHERE userid=?", values)
+
+        await ctx.respond("Birthday Set")
+
+    @birthday.command(name = "check", description = "Check for user birthdays")
+    @default_permissions(administrator = True)
+    async def birthday_forcereminder(self, ctx: discord.ApplicationContext):
+        count = await self.sendbirthdays()
+
+        await ctx.respond(f"Birthday check done, {count} reminders sent")
+
+    # Send the reminders for today's birthdays, the cost depends on the number of birthdays today and not on the number of users
+    async def sendbirthdays(self):
+        now = datetime.now(timezone.utc)
+
+        # For anyone with a leap day birthday, just have the reminder on the 28th of February
+        if now.month == 2 and now.day == 29:
+            return 0
+        elif now.month == 2 and now.day == 28:
+            days = (28, 29)
+        else:
+            days = (now.day, now.day)
+
+        res = await usermetadb.fetchall("SELECT DISTINCT userid FROM usermeta WHERE birthmonth = ? AND birthday IN (?, ?)", (now.month, days[0], days[1]))
+        if not res:
+            return 0
+
+        guildchannels = await guildmetadb.fetchall("SELECT guildid, birthdaychannel FROM guildmeta WHERE birthdaychannel != 0")
+
+        count = 0
+        for guildid, channelid in guildchannels:
+            guild = self.client.get_guild(guildid)
+            channel = self.client.get_channel(channelid)
+            if not guild or not channel:
+                cog_logger.warning(f"Birthday channel {channelid} of guild {guildid} not found")
+                continue
+
+            for (userid,) in res:
+                if guild.get_member(userid):
+                    embed = discord.Embed(title = "Happy Birthday", color = 0x00ffff)
+                    embed.add_field(name = "", value = f"It is the birthday of <@{userid}>")
+                    await channel.send(embed = embed)
+                    count += 1
+
+        cog_logger.info(f"Sent {count} birthday reminders")
+
+        return count
+
+    @tasks.loop(time = time(0, 0, tzinfo = timezone.utc))
+    async def birthday_reminder(self):
+        await self.sendbirthdays()
+
+    @birthday.command(name = "config", description = "Configure the birthday reminder feature")
+    @default_permissions(administrator = True)
+    async def birthday_config(self, ctx: discord.ApplicationContext, channel: discord.Option(discord.TextChannel, "Channel to send messages in", required = True)):
+        if not ctx.guild:
+            await ctx.respond("This command must be used in a guild")
+            return
+
+        await guildmetadb.execute("UPDATE guildmeta SET birthdaychannel=? WHERE guildid=?", (channel.id, ctx.guild.id))
+
+        await ctx.respond(f"Birthday message channel set to {channel.mention}")
+
+    @user.command(name = "info", description = "Displays information about a user")
+    async def user_info(self, ctx: discord.ApplicationContext, user: discord.Option(discord.User, "User", required = False)):
+        date_format = "%B %d, %Y %I:%M %p"
+
+        # Default to the user that invoked the command
+        if user is None:
+            user = ctx.author
+            fetched_user = await self.client.fetch_user(ctx.author.id)
+        else:
+            try:
+                user = await ctx.guild.fetch_member(user.id)
+                fetched_user = await self.client.fetch_user(user.id)
+            except (MemberNotFound, NotFound):
+                try:
+                    user = await self.client.fetch_user(user.id)
+                    fetched_user = user
+                except MemberNotFound:
+                    await ctx.respond(f"User {user.id} not found")
+                    return
+            except (AttributeError):
+                # AttributeError may be raised if ctx.guild is None, such as in DMs
+                user = await self.client.fetch_user(user.id)
+                fetched_user = user
+
+        if fetched_user.accent_colour:
+            user_color = fetched_user.accent_colour
+        else:
+            user_color = fetched_user.color
+
+        embed = discord.Embed(title = f"User Information for {user}", color = user_color)
+        embed.set_author(name = str(user), icon_url = user.default_avatar)
+        embed.set_thumbnail(url = user.display_avatar)
+
+        embed.add_field(name = "Username", value = user.name, inline = True)
+        if isinstance(user, discord.Member):
+            embed.add_field(name = "Nickname", value = user.nick, inline = True)
+        else:
+            embed.add_field(name = "Global Name", value = user.display_name, inline = True)
+
+        embed.add_field(name = "User ID", value = user.id, inline = True)
+
+        if isinstance(user, discord.Member):
+            embed.add_field(name = "Joined", value = user.joined_at.strftime(date_format), inline = False)
+
+        embed.add_field(name = "Registered", value = user.created_at.strftime(date_format), inline = False)
+
+        # Display roles
+        if isinstance(user, discord.Member):
+            if user in ctx.guild.members:
+                members = sorted(ctx.guild.members, key=lambda m: m.joined_at)
+                embed.add_field(name = "Join position", value = str(members.index(user) + 1), inline = False)
+            else:
+                embed.add_field(name = "Join position", value = "N/A", inline = False)
+
+            if len(user.roles) > 1:
+                role_string = ' '.join([r.mention for r in user.roles][1:])
+                embed.add_field(name = "Roles [{}]".format(len(user.roles) - 1), value = role_string, inline = False)
+
+            embed.add_field(name = "Status on Mobile", value = user.mobile_status, inline = True)
+            embed.add_field(name = "Status on Desktop", value = user.desktop_status, inline = True)
+            embed.add_field(name = "Status on Web", value = user.web_status, inline = True)
+
+        embed.add_field(name = "Is bot", value = user.bot, inline = True)
+
+        # Avoiding the use of flag bits here since it overcomplicates things and Python endianness depends on the CPU
+        user_flags = ""
+        if user.public_flags.staff:
+            user_flags += f"User is a Discord Employee\n"
+        if user.public_flags.partner:
+            user_flags += f"User is a Discord Partner\n"
+        if user.public_flags.hypesquad:
+            user_flags += f"User is a HypeSquad Events member\n"
+        if user.public_flags.bug_hunter:
+            user_flags += f"User is a Bug Hunter\n"
+        if user.public_flags.bug_hunter_level_2:
+            user_flags += f"User is a Bug Hunter Level 2\n"
+        if user.public_flags.hypesquad_bravery:
+            user_flags += f"User is a HypeSquad Bravery Member\n"
+        if user.public_flags.hypesquad_brilliance:
+            user_flags += f"User is a HypeSquad Brilliance Member\n"
+        if user.public_flags.hypesquad_balance:
+            user_flags += f"User is a HypeSquad Balance Member\n"
+        if user.public_flags.early_supporter:
+            user_flags += f"User is an Early Supporter (Nitro before Oct 10 2018)\n"
+        if user.public_flags.team_user:
+            user_flags += f"User is a Team User\n"
+        if user.public_flags.system:
+            user_flags += f"User is a System User\n"
+        if user.public_flags.verified_bot:
+            user_flags += f"User is a Verified Bot\n"
+        if user.public_flags.verified_bot_developer:
+            user_flags += f"User is an Early Verified Bot Developer\n"
+        if user.public_flags.discord_certified_moderator:
+            user_flags += f"User is a Discord Certified Moderator\n"
+        if user.public_flags.active_developer:
+            user_flags += f"User is an Active Developer\n"
+
+        embed.add_field(name = "User Flags", value = user_flags, inline = False)
+
+        embed.add_field(name = "User URL", value = user.jump_url, inline = False)
+
+        await ctx.respond(embed = embed)
+
+    @user.command(name = "spotify", description = "Displays known information about a user's Spotify activity")
+    async def user_spotify(self, ctx: discord.ApplicationContext, user: discord.Option(discord.User, "User", required = True)):
+        # adduser is set to false since there would be no data if the user db was just created
+        userdb = await checkuserindb(self.client, user.id, adduser = False)
+
+        if not userdb:
+            await ctx.respond("No information for this user found")
+            return
+
+        where, params = userstore.where(user.id)
+
+        res = await getdb(userdb).fetchall("SELECT spotifyartist, spotifyid FROM useractivity" + where, params)
+
+        alltracks = []
+        for entry in res:
+            if entry[1] != "":
+                alltracks.append(entry[0])
+
+        artists = set([])
+        for entry in res:
+            if entry[0] != "":
+                artists.add(entry[0])
+
+        tracks = set([])
+        for entry in res:
+            if entry[1] != "":
+                tracks.add(entry[1])
+
+        trackcount = len(tracks)
+
+        artistsstring = ""
+        if len(artists) > 0:
+            for artist in artists:
+                artistsstring += f"{artist}\n"
+
+        mostlistenedto = ""
+        for x, y in Counter(alltracks).most_common():
+            mostlistenedto += f"{x}: {y}\n"
+
+        embed = discord.Embed(title = f"Spotify information for {user.name}", color = 0x00e000)
+        embed.add_field(name = "Known Artists", value = artistsstring, inline = False)
+        embed.add_field(name = "Unique Track Count", value = str(trackcount), inline = False)
+        embed.add_field(name = "Most listened to", value = mostlistenedto, inline = False)
+
+        await ctx.respond(embed = embed)
+
+    @user.command(name = "gather", description = "Collect the message history of every channel, resuming where the last run stopped")
+    @default_permissions(administrator = True)
+    async def user_gather(self, ctx: discord.ApplicationContext):
+        if self.gathering:
+            await ctx.respond(embed = mkerrembed("Message gathering is already running"))
+            return
+
+        self.gathering = True
+        await ctx.respond("Message gathering started")
+
+        try:
+            count, failed = await gathermessages(self.client)
+        finally:
+            self.gathering = False
+
+        msg = f"Message gathering done, {count} messages gathered"
+        if failed:
+            msg += f", {len(failed)} channels failed and will be resumed on the next run: " + ", ".join(channel.mention for channel in failed[:20])
+            if len(failed) > 20:
+                msg += f" and {len(failed) - 20} more"
+
+        await ctx.followup.send(msg)
+
+    @user.command(name = "migrate", description = "Import per-user databases into the shared user databases")
+    @default_permissions(administrator = True)
+    async def user_migrate(self, ctx: discord.ApplicationContext, srcdir: discord.Option(str, "Directory with the user_*.db files - defaults to data/user/", required = False)):
+        if userstore.peruser:
+            await ctx.respond(embed = mkerrembed("User data storage is set to \"peruser\", there is nothing to migrate to"))
+            return
+
+        if not srcdir:
+            srcdir = "data/user/"
+
+        if not os.path.isdir(srcdir):
+            await ctx.respond(embed = mkerrembed(f"Directory not found: {srcdir}"))
+            return
+
+        await ctx.defer()
+
+        # Anything still queued has to be written before its database is read
+        await msgwriter.flush()
+        filecount, rowcount = await dbcall(migrateusers, srcdir)
+
+        await asyncio.to_thread(usercache.load)
+        usercache.loadmembers(self.client)
+
+        await ctx.respond(f"Imported {rowcount} rows from {filecount} user databases")
+
+    @Cog.listener()
+    @metrics.timed("listener")
+    async def on_guild_join(self, guild):
+        cog_logger.info("Bot joined guild, refreshing users")
+        await refreshusers(self.client)
+
+    @Cog.listener()
+    @metrics.timed("listener")
+    async def on_message(self, msg):
+        # Do not log messages from bots
+        if msg.author.bot:
+            return
+
+        author = msg.author.id
+        eventlog.write("message", guild = msg.guild.id if msg.guild else None, channel = msg.channel.id, user = author, msg = msg.id)
+        userdb = await checkuserindb(self.client, author)
+
+        if not userdb:
+            return
+
+        timestamp = datetime.timestamp(datetime.now())
+        msgid = msg.id
+        channelid = msg.channel.id
+        if msg.guild:
+            guildid = msg.guild.id
+        else:
+            guildid = 0
+        isdeleted = 0
+        msgcontent = msg.content
+
+        entry = (timestamp, msgid, channelid, guildid, isdeleted, msgcontent)
+
+        msgwriter.put(*userstore.insert("usermessages", author, entry, ignore = True))
+        msgindex.add(msgid, author, channelid, guildid)
+
+    # Deletes and edits are queued behind the insert of the message if it has not been written yet
+    async def markdeleted(self, msgids, channelid, guildid):
+        authors = await msgindex.authors(msgids)
+
+        for msgid in msgids:
+            eventlog.write("message_delete", guild = guildid, channel = channelid, user = authors.get(msgid), msg = msgid)
+
+            paths = msgindex.paths(authors, msgid)
+            if not paths:
+                cog_logger.info(f"Message not found: {msgid}")
+
+            for path in paths:
+                msgwriter.put(path, "UPDATE usermessages SET isdeleted = 1 WHERE msgid = ?", (msgid,))
+
+    @Cog.listener()
+    @metrics.timed("listener")
+    async def on_raw_message_delete(self, payload):
+        await self.markdeleted([payload.message_id], payload.channel_id, payload.guild_id)
+
+    @Cog.listener()
+    @metrics.timed("listener")
+    async def on_raw_bulk_message_delete(self, payload):
+        await self.markdeleted(list(payload.message_ids), payload.channel_id, payload.guild_id)
+
+    @Cog.listener()
+    @metrics.timed("listener")
+    async def on_raw_message_edit(self, payload):
+        data = payload.data
+
+        # Edits that only change embeds or flags have no content
+        if "content" not in data:
+            return
+
+        if "author" in data:
+            # As with new messages, edits by bots are not logged, even ones not in the cache yet
+            if data["author"].get("bot"):
+                return
+            userid = int(data["author"]["id"])
+        else:
+            userid = (await msgindex.authors([payload.message_id])).get(payload.message_id)
+
+        eventlog.write("message_edit", guild = payload.guild_id, channel = payload.channel_id, user = userid, msg = payload.message_id)
+
+        if userid is None:
+            return
+
+        # Only users that already have a database, anyone else would get an empty per-user file without tables. Users dropped from the cache, such as by on_member_update, are looked up again.
+        if not await checkuserindb(self.client, userid, adduser = False):
+            return
+
+        timestamp = datetime.timestamp(datetime.now())
+        for statement in userstore.edit(userid, payload.message_id, timestamp, data["content"]):
+            msgwriter.put(*statement)
+
+    @Cog.listener()
+    @metrics.timed("listener")
+    async def on_presence_update(self, before, after):
+        userid = after.id
+
+        # Once again, do not log bots
+        if after.bot:
+            return
+
+        userdb = await checkuserindb(self.client, userid)
+
+        if not userdb:
+            return
+
+        activities = after.activities
+
+        timestamp = datetime.timestamp(datetime.now())
+        status_mobile = onlinestatus[str(after.mobile_status)]
+        status_desktop = onlinestatus[str(after.desktop_status)]
+        status_web = onlinestatus[str(after.web_status)]
+        userstatus = ""
+        userstatusemoji = ""
+        activitytype = ""
+        activityurl = ""
+        activityname = ""
+        activitydetails = ""
+        activityid = 0
+        activitysessionid = 0
+        activityemoji = ""
+        spotifytitle = ""
+        spotifyalbum = ""
+        spotifyartist = ""
+        spotifyid = ""
+
+        if activities != ():
+            for activity in activities:
+                if isinstance(activity, discord.CustomActivity):
+                    userstatus = activity.name
+                    if activity.emoji:
+                        userstatusemoji = activity.emoji.name
+                elif isinstance(activity, discord.Activity):
+                    if activity.type == discord.ActivityType.playing:
+                        activitytype = "playing"
+                    elif activity.type == discord.ActivityType.streaming:
+                        activitytype = "streaming"
+                    elif activity.type == discord.ActivityType.listening:
+                        activitytype = "listening"
+                    elif activity.type == discord.ActivityType.watching:
+                        activitytype = "watching"
+
+                    if activity.url:
+                        activityurl = activity.url
+                    if activity.name:
+                        activityname = activity.name
+                    if activity.details:
+                        activitydetails = activity.details
+                    if activity.application_id:
+                        activityid = activity.application_id
+                    if activity.emoji:
+                        activityemoji = activity.emoji.name
+                elif isinstance(activity, discord.Spotify):
+                    spotifytitle = activity.title
+                    spotifyalbum = activity.album
+                    spotifyartist = activity.artist
+                    spotifyid = activity.track_id
+
+        entry = (timestamp, status_web, status_mobile, status_desktop, userstatus, userstatusemoji, activitytype, activityurl, activityname, activitydetails, activityid, activitysessionid, activityemoji, spotifytitle, spotifyalbum, spotifyartist, spotifyid)
+
+        presencetracker.update(userid, entry)
+
+    @tasks.loop(seconds = 1)
+    async def presence_flush(self):
+        for userid, entry in presencetracker.due():
+            msgwriter.put(*userstore.insert("useractivity", userid, entry))
+
+    @tasks.loop(minutes = config.presence_stats_interval)
+    async def presence_stats(self):
+        cog_logger.info(presencetracker.stats())
+
+# In-process view of which users are known, non-bot users and where their database is, so the event listeners do not have to hit the REST API or usermeta.db
+class UserCache:
+    def __init__(self):
+        # User ID to database path, or False for bots and users that do not exist
+        self.users = {}
+
+    # Load every user that already has a database, replacing what was cached. This blocks, so it is run in a thread.
+    def load(self):
+        users = {}
+        dbc = sqlite3.connect("data/user/usermeta.db")
+        cur = dbc.cursor()
+        for (userid,) in cur.execute("SELECT userid FROM usermeta"):
+            users[userid] = userstore.path(userid)
+        dbc.close()
+
+        # Swapped in at once so the listeners never see a half loaded cache
+        self.users = users
+
+    # Mark every bot found in the gateway member cache
+    def loadmembers(self, client):
+        for guild in client.guilds:
+            for member in guild.members:
+                if member.bot:
+                    self.users[member.id] = False
+
+    def get(self, userid):
+        return self.users.get(userid)
+
+    def set(self, userid, userdb):
+        self.users[userid] = userdb
+
+    # Entries that are dropped are looked up again in usermeta.db the next time they are needed
+    def invalidate(self, userid):
+        self.users.pop(userid, None)
+
+usercache = UserCache()
+
+# Create the database of a user that is not in usermeta yet
+async def createuserdb(userid):
+    userdb = userstore.path(userid)
+
+    # The shared databases are created in setup()
+    if userstore.peruser:
+        cog_logger.info(f"Creating database for {userid}")
+
+        if os.path.exists(userdb):
+            cog_logger.info(f"Database for {userid} exists but not present in usermeta, removing")
+            # The database threads may still have the old file open
+            dbforget(userdb)
+            os.remove(userdb)
+
+        with open("cogs/user/userdb.sql") as f:
+            userdbschema = f.read()
+
+        await getdb(userdb).executescript(userdbschema)
+
+async def checkuserindb(client, userid, adduser = True):
+    userdb = usercache.get(userid)
+    if userdb is not None:
+        return userdb
+
+    # Only users the gateway has not told us about yet end up going over REST
+    user = client.get_user(userid)
+    if not user:
+        try:
+            user = await client.fetch_user(userid)
+        except discord.NotFound:
+            cog_logger.warning(f"User {userid} not found")
+            # Such as a deleted account, remembered so its messages during a backfill do not each cost a request
+            usercache.set(userid, False)
+            return False
+        except discord.HTTPException as err:
+            # Rate limits and server errors are not cached, the user is looked up again next time
+            cog_logger.warning(f"Looking up user {userid} failed: {err}")
+            return False
+
+    if user.bot:
+        cog_logger.warning(f"User {userid} is a bot")
+        usercache.set(userid, False)
+        return False
+
+    usermeta = await usermetadb.fetchone("SELECT userid, userdb, blacklisted FROM usermeta WHERE userid=?", (userid,))
+
+    userdb = userstore.path(userid)
+
+    if usermeta:
+        usercache.set(userid, userdb)
+        # Return database file path
+        return userdb
+    else:
+        if adduser:
+            cog_logger.info(f"Adding {userid} to {userdb}")
+            await createuserdb(userid)
+
+            values = (userid, userdb, datetime.timestamp(user.created_at), 0, 0, 0, 0)
+
+            # Fields for the one table in "usermeta.db" should be set UNIQUE for this to work properly. See https://www.sqlite.org/lang_conflict.html.
+            await usermetadb.execute("INSERT OR IGNORE INTO usermeta VALUES(?, ?, ?, ?, ?, ?, ?)", values)
+
+            usercache.set(userid, userdb)
+            return userdb
+        else:
+            cog_logger.warning(f"User {userid} not found in database")
+            return False
+
+backfilldb = getdb("data/user/backfill.db")
+
+# Write one batch of history and then move the checkpoint of the channel past it, so an interrupted backfill resumes after the last batch that made it to disk
+async def writehistory(channelid, lastmsgid, statements):
+    paths = {}
+    for path, sql, params in statements:
+        paths.setdefault(path, []).append((sql, params))
+
+    for path, pathstatements in paths.items():
+        await getdb(path).executebatch(pathstatements)
+
+    await backfilldb.execute("INSERT OR REPLACE INTO backfill VALUES(?, ?)", (channelid, lastmsgid))
+
+async def gatherchannel(client, channel, after, semaphore):
+    async with semaphore:
+        statements = []
+        lastmsgid = after
+        count = 0
+        sincecheckpoint = 0
+
+        if after:
+            history = channel.history(limit = None, after = discord.Object(id = after), oldest_first = True)
+        else:
+            history = channel.history(limit = None, oldest_first = True)
+
+        try:
+            async for message in history:
+                lastmsgid = message.id
+                sincecheckpoint += 1
+
+                if not message.author.bot:
+                    userdb = await checkuserindb(client, message.author.id)
+                    if userdb:
+                        values = (datetime.timestamp(message.created_at), message.id, channel.id, channel.guild.id, 0, message.content)
+                        statements.append(userstore.insert("usermessages", message.author.id, values, ignore = True))
+                        statements.append(msgindex.statement(message.id, message.author.id, channel.id, channel.guild.id))
+                        count += 1
+
+                if sincecheckpoint >= config.backfill_batch:
+                    await writehistory(channel.id, lastmsgid, statements)
+                    statements = []
+                    sincecheckpoint = 0
+        except Forbidden:
+            sys_logger.warning(f"HTTP 403 encountered when processing channel: {channel.id}")
+        except HTTPException as err:
+            # Such as a server error or the channel being deleted during the run, the next run resumes from the last checkpoint
+            sys_logger.error(f"Gathering messages from channel {channel.id} failed: {err}")
+            raise
+        finally:
+            if sincecheckpoint:
+                await writehistory(channel.id, lastmsgid, statements)
+
+        cog_logger.info(f"Gathered {count} messages from channel {channel.id}")
+
+        return count
+
+# Stream the message history of every text channel into the user databases. Channels are read concurrently, limited by backfill_concurrency so the backfill stays well clear of the global rate limit, pycord handles the per-route limits itself.
+async def gathermessages(client):
+    checkpoints = dict(await backfilldb.fetchall("SELECT channelid, lastmsgid FROM backfill"))
+    semaphore = asyncio.Semaphore(config.backfill_concurrency)
+
+    channels = [channel for channel in client.get_all_channels() if isinstance(channel, discord.TextChannel)]
+
+    cog_logger.info(f"Gathering messages from {len(channels)} channels")
+
+    # One channel failing does not stop the others, and the command only returns once every channel is done
+    results = await asyncio.gather(*[gatherchannel(client, channel, checkpoints.get(channel.id), semaphore) for channel in channels], return_exceptions = True)
+
+    count = 0
+    failed = []
+    for channel, res in zip(channels, results):
+        if isinstance(res, BaseException):
+            if not isinstance(res, HTTPException):
+                cog_logger.error(f"Gathering messages from channel {channel.id} failed", exc_info = res)
+            failed.append(channel)
+        else:
+            count += res
+
+    cog_logger.info(f"Message gathering done, {count} messages gathered, {len(failed)} channels failed")
+
+    return count, failed
+
+# Import legacy per-user databases from "srcdir" into the shared databases. If "srcdir" has its own usermeta.db, such as "data/users/" of the old users cog, its users are imported as well.
+def migrateusers(srcdir):
+    usermetapath = os.path.join(srcdir, "usermeta.db")
+    dbc = sqlite3.connect("data/user/usermeta.db")
+    shards = {}
+
+    try:
+        if os.path.exists(usermetapath) and not os.path.samefile(usermetapath, "data/user/usermeta.db"):
+            dbc.execute("ATTACH DATABASE ? AS src", (usermetapath,))
+            with dbc:
+                # Users are normally already in usermeta as refreshusers() adds every member at startup, their legacy birthdays are only taken if none was set since. The key is (userid, userdb), so inserting these again would add a second row for the same user.
+                res = dbc.execute("""UPDATE main.usermeta SET birthyear = legacy.birthyear, birthmonth = legacy.birthmonth, birthday = legacy.birthday, blacklisted = max(main.usermeta.blacklisted, legacy.blacklisted)
+                    FROM src.usermeta AS legacy WHERE main.usermeta.userid = legacy.userid AND (main.usermeta.birthmonth = 0 OR main.usermeta.birthmonth IS NULL) AND legacy.birthmonth != 0""")
+                cog_logger.info(f"Merged {res.rowcount} legacy birthdays from {usermetapath}")
+
+                legacy = dbc.execute("SELECT userid, register_date, blacklisted, birthyear, birthmonth, birthday FROM src.usermeta WHERE userid NOT IN (SELECT userid FROM main.usermeta)").fetchall()
+                res = dbc.executemany("INSERT OR IGNORE INTO main.usermeta VALUES(?, ?, ?, ?, ?, ?, ?)", [(row[0], userstore.path(row[0])) + row[1:] for row in legacy])
+                cog_logger.info(f"Imported {res.rowcount} users from {usermetapath}")
+            dbc.execute("DETACH DATABASE src")
+
+        files = {}
+        for filename in os.listdir(srcdir):
+            match = re.fullmatch(r"user_(\d+)\.db", filename)
+            if match:
+                files[int(match.group(1))] = os.path.join(srcdir, filename)
+
+        tables = ["userinfo", "useractivity", "usermessages", "messageedit"]
+        rowcount = 0
+        skipped = 0
+
+        for userid, path in files.items():
+            shardpath = userstore.path(userid)
+            if shardpath not in shards:
+                shards[shardpath] = sqlite3.connect(shardpath)
+            shard = shards[shardpath]
+
+            if shard.execute("SELECT 1 FROM main.migrated WHERE userid = ?", (userid,)).fetchone():
+                skipped += 1
+                continue
+
+            # ATTACH is not allowed inside of a transaction, so each file gets its own
+            shard.execute("ATTACH DATABASE ? AS src", (path,))
+            with shard:
+                for table in tables:
+                    # Only copy columns both sides have, the legacy messageedit table was missing a column
+                    srccols = [row[1] for row in shard.execute(f"PRAGMA src.table_info({table})")]
+                    dstcols = [row[1] for row in shard.execute(f"PRAGMA main.table_info({table})")]
+                    cols = ", ".join([col for col in srccols if col in dstcols])
+                    if not cols:
+                        continue
+
+                    res = shard.execute(f"INSERT OR IGNORE INTO main.{table} (userid, {cols}) SELECT ?, {cols} FROM src.{table}", (userid,))
+                    rowcount += res.rowcount
+
+                # In the same transaction as the rows, so a file is either imported and recorded or neither
+                shard.execute("INSERT INTO main.migrated VALUES(?, ?, ?)", (userid, path, datetime.timestamp(datetime.now())))
+            shard.execute("DETACH DATABASE src")
+
+        # Rows from before the shared databases still point at the per-user file. OR IGNORE skips a user that somehow has a row for the shared database as well, rather than failing after the data is already copied.
+        with dbc:
+            dbc.executemany("UPDATE OR IGNORE usermeta SET userdb=? WHERE userid=?", [(userstore.path(userid), userid) for userid in files])
+    finally:
+        for shard in shards.values():
+            shard.close()
+        dbc.close()
+
+    cog_logger.info(f"Imported {rowcount} rows from {len(files) - skipped} user databases in {srcdir}, {skipped} already imported")
+
+    return len(files) - skipped, rowcount
+
+# Refresh the users while not collecting message history
+async def refreshusers(client):
+    start = perf_counter()
+
+    members = {}
+    for guild in client.guilds:
+        for member in guild.members:
+            if not member.bot:
+                members[member.id] = member
+
+    known = set(row[0] for row in await usermetadb.fetchall("SELECT userid FROM usermeta"))
+    new = [member for memberid, member in members.items() if memberid not in known]
+
+    if userstore.peruser:
+        for member in new:
+            await createuserdb(member.id)
+
+    values = [(member.id, userstore.path(member.id), datetime.timestamp(member.created_at), 0, 0, 0, 0) for member in new]
+    await usermetadb.executemany("INSERT OR IGNORE INTO usermeta VALUES(?, ?, ?, ?, ?, ?, ?)", values)
+
+    for memberid in members:
+        usercache.set(memberid, userstore.path(memberid))
+
+    cog_logger.info(f"Refreshed {len(members)} users, {len(new)} added, in {perf_counter() - start:.2f} seconds")
+
+# Create or upgrade the databases
+def createdbs():
+    os.makedirs("data/user/", exist_ok = True)
+
+    if not os.path.exists(f"data/user/guildmeta.db"):
+        dbc = sqlite3.connect(f"data/user/guildmeta.db")
+        cur = dbc.cursor()
+        with open("cogs/user/guildmeta.sql") as f:
+            cur.executescript(f.read())
+        dbc.commit()
+        dbc.close()
+
+    # Also adds indexes that databases created by older versions are missing
+    dbc = sqlite3.connect(f"data/user/usermeta.db")
+    cur = dbc.cursor()
+    with open("cogs/user/usermeta.sql") as f:
+        cur.executescript(f.read())
+    dbc.commit()
+    dbc.close()
+
+    with open("cogs/user/userdata.sql") as f:
+        userdataschema = f.read()
+
+    for shardpath in userstore.shardpaths():
+        dbc = sqlite3.connect(shardpath)
+        dbc.executescript(userdataschema)
+        dbc.close()
+
+    with open("cogs/user/backfill.sql") as f:
+        dbc = sqlite3.connect("data/user/backfill.db")
+        dbc.executescript(f.read())
+        dbc.close()
+
+    with open("cogs/user/msgindex.sql") as f:
+        dbc = sqlite3.connect("data/user/msgindex.db")
+        dbc.executescript(f.read())
+        dbc.close()
+
+    usercache.load()
+
+async def warmup(client):
+    await asyncio.to_thread(createdbs)
+
+# Add guilds that joined while SLAG was offline, the guild list is only known once connected
+async def addguilds(client):
+    count = await guildmetadb.executemany("INSERT OR IGNORE INTO guildmeta VALUES(?, ?, ?)", [(guild.id, 0, 0) for guild in client.guilds])
+    if count:
+        cog_logger.info(f"Added {count} guilds to guildmeta")
+
+def setup(client):
+    client.add_cog(User(client))
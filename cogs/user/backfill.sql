@@ -0,0 +1,5 @@
+-- Progress of the message history backfill, the newest message already written for each channel
+CREATE TABLE IF NOT EXISTS backfill (
+    channelid INT PRIMARY KEY,
+    lastmsgid INT
+);
@@ -0,0 +1,6 @@
+CREATE TABLE guildmeta (
+    guildid INT,
+    welcomerchannel INT,
+    birthdaychannel INT,
+    UNIQUE(guildid)
+);
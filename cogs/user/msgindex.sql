@@ -0,0 +1,7 @@
+-- Author and channel of every logged message, so deletes and edits can be applied from raw gateway events
+CREATE TABLE IF NOT EXISTS msgindex (
+    msgid INT PRIMARY KEY,
+    userid INT,
+    channelid INT,
+    guildid INT
+);
@@ -0,0 +1,72 @@
+-- Consolidated user data, shared by every user in a shard. Same tables as userdb.sql with the user ID added.
+
+-- Table for the information of a user that can change
+CREATE TABLE IF NOT EXISTS userinfo (
+    userid INT,
+    timestamp REAL,
+    username VARCHAR(64),
+    nickname VARCHAR(64),
+    birthday_tz VARCHAR(64),
+    birthday_day INT,
+    birthday_month INT,
+    birthday_year INT
+);
+
+-- Table of the log of status and activity of the user
+CREATE TABLE IF NOT EXISTS useractivity (
+    userid INT,
+    timestamp REAL,
+    status_web INT,
+    status_mobile INT,
+    status_desktop INT,
+    userstatus VARCHAR(128),
+    userstatusemoji VARCHAR(32),
+    activitytype VARCHAR(12),
+    activityurl VARCHAR(128),
+    activityname VARCHAR(128),
+    activitydetails VARCHAR(128),
+    activityid INT,
+    activitysessionid INT,
+    activityemoji VARCHAR(32),
+    spotifytitle VARCHAR(128),
+    spotifyalbum VARCHAR(128),
+    spotifyartist VARCHAR(128),
+    spotifyid VARCHAR(22)
+);
+
+-- Log of messages of the user
+CREATE TABLE IF NOT EXISTS usermessages (
+    userid INT,
+    timestamp REAL,
+    msgid INT,
+    channelid INT,
+    guildid INT,
+    isdeleted INT,
+    msgcontent VARCHAR(4000),
+    UNIQUE(msgid)
+);
+
+-- Log of edits done to messages
+CREATE TABLE IF NOT EXISTS messageedit (
+    userid INT,
+    timestamp REAL,
+    msgid INT,
+    channelid INT,
+    guildid INT,
+    oldcontent VARCHAR(4000),
+    newcontent VARCHAR(4000)
+);
+
+-- Legacy per-user databases imported by /user migrate. Only usermessages has a unique key, so importing a file twice would double the rows of the other tables.
+CREATE TABLE IF NOT EXISTS migrated (
+    userid INT PRIMARY KEY,
+    srcpath VARCHAR(255),
+    timestamp REAL
+);
+
+CREATE INDEX IF NOT EXISTS userinfo_user ON userinfo (userid, timestamp);
+CREATE INDEX IF NOT EXISTS useractivity_user ON useractivity (userid, timestamp);
+CREATE INDEX IF NOT EXISTS usermessages_user ON usermessages (userid, timestamp);
+CREATE INDEX IF NOT EXISTS usermessages_channel ON usermessages (channelid, timestamp);
+CREATE INDEX IF NOT EXISTS messageedit_user ON messageedit (userid, timestamp);
+CREATE INDEX IF NOT EXISTS messageedit_msg ON messageedit (msgid);
@@ -0,0 +1,12 @@
+CREATE TABLE IF NOT EXISTS usermeta (
+    userid INT,
+    userdb VARCHAR(255),
+    register_date REAL,
+    blacklisted INT,
+    birthyear INT,
+    birthmonth INT,
+    birthday INT,
+    UNIQUE(userid, userdb)
+);
+
+CREATE INDEX IF NOT EXISTS usermeta_birthday ON usermeta (birthmonth, birthday);
@@ -0,0 +1,147 @@
+# SLAG - CTCL 2024
+# File: eventquery.py
+# Purpose: Offline search of the event log written by EventLog in lib.py
+# Created: October 18, 2026
+# Modified: October 18, 2026
+
+# Examples:
+#   python eventquery.py --channel 1234 --event message_delete --since 2026-10-11
+#   python eventquery.py --user 5678 --since "2026-10-18 09:00" --until "2026-10-18 12:00" --text
+
+import argparse
+import glob
+import json
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+# Dates and times are taken as UTC unless they have an offset
+def parsetime(value):
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo = timezone.utc)
+
+    return dt.timestamp()
+
+def matchesblock(index, args):
+    if args.since is not None and index["end"] < args.since:
+        return False
+    if args.until is not None and index["start"] >= args.until:
+        return False
+    if args.event and not set(args.event) & set(index["events"]):
+        return False
+    if args.guild and args.guild not in index["guilds"]:
+        return False
+    if args.channel and args.channel not in index["channels"]:
+        return False
+    if args.user and args.user not in index["users"]:
+        return False
+
+    return True
+
+def matchesentry(entry, args):
+    if args.since is not None and entry["t"] < args.since:
+        return False
+    if args.until is not None and entry["t"] >= args.until:
+        return False
+    if args.event and entry["event"] not in args.event:
+        return False
+    if args.guild and entry.get("guild") != args.guild:
+        return False
+    if args.channel and entry.get("channel") != args.channel:
+        return False
+    if args.user and entry.get("user") != args.user:
+        return False
+
+    return True
+
+# Entries of one day's file that match, reading only the blocks whose index line says they can
+def searchday(path, args, stats):
+    blocks = []
+    try:
+        with open(path[:-len(".jsonl")] + ".idx") as f:
+            for line in f:
+                if line.strip():
+                    blocks.append(json.loads(line))
+    except FileNotFoundError:
+        pass
+
+    blocks.sort(key = lambda index: index["offset"])
+
+    with open(path, "rb") as f:
+        ranges = [(index["offset"], index["length"]) for index in blocks if matchesblock(index, args)]
+        stats["blocks"] += len(blocks)
+        stats["read"] += len(ranges)
+
+        # Any bytes not covered by an index line were written without one, such as when writing the .idx file failed or the bot crashed before it, and have to be read in full. New blocks are appended after these, so they are not always at the end.
+        covered = 0
+        for index in blocks:
+            if index["offset"] > covered:
+                ranges.append((covered, index["offset"] - covered))
+            covered = max(covered, index["offset"] + index["length"])
+
+        size = os.path.getsize(path)
+        if size > covered:
+            ranges.append((covered, size - covered))
+
+        ranges.sort()
+
+        for offset, length in ranges:
+            f.seek(offset)
+            for line in f.read(length).splitlines():
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Such as a line cut short by a crash
+                    continue
+
+                if matchesentry(entry, args):
+                    yield entry
+
+def formatentry(entry):
+    text = datetime.fromtimestamp(entry["t"], timezone.utc).strftime("%Y-%m-%d %H:%M:%S") + " " + entry["event"]
+    for key, value in entry.items():
+        if key not in ("t", "event"):
+            text += f" {key}={value}"
+
+    return text
+
+def main():
+    parser = argparse.ArgumentParser(description = "Search the SLAG event log")
+    parser.add_argument("--dir", default = "data/events", help = "Event log directory - defaults to data/events")
+    parser.add_argument("--guild", type = int, help = "Guild ID")
+    parser.add_argument("--channel", type = int, help = "Channel ID")
+    parser.add_argument("--user", type = int, help = "User ID")
+    parser.add_argument("--event", action = "append", help = "Event type such as message_delete, can be given more than once")
+    parser.add_argument("--since", type = parsetime, help = "Start date or time, UTC unless an offset is given")
+    parser.add_argument("--until", type = parsetime, help = "End date or time, not included")
+    parser.add_argument("--text", action = "store_true", help = "Print readable lines instead of JSON")
+    parser.add_argument("--stats", action = "store_true", help = "Print how many blocks were read to stderr")
+    args = parser.parse_args()
+
+    stats = {"files": 0, "blocks": 0, "read": 0, "matches": 0}
+
+    for path in sorted(glob.glob(os.path.join(args.dir, "events-*.jsonl"))):
+        # Files are per UTC day, so whole days can be skipped by their name
+        try:
+            day = datetime.strptime(os.path.basename(path)[len("events-"):-len(".jsonl")], "%Y-%m-%d").replace(tzinfo = timezone.utc)
+        except ValueError:
+            continue
+        if args.until is not None and day.timestamp() >= args.until:
+            continue
+        if args.since is not None and (day + timedelta(days = 1)).timestamp() <= args.since:
+            continue
+
+        stats["files"] += 1
+        for entry in searchday(path, args, stats):
+            stats["matches"] += 1
+            if args.text:
+                print(formatentry(entry))
+            else:
+                print(json.dumps(entry, separators = (",", ":")))
+
+    if args.stats:
+        print(f"{stats['matches']} matches, read {stats['read']} of {stats['blocks']} blocks in {stats['files']} files", file = sys.stderr)
+
+if __name__ == "__main__":
+    main()
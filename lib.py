@@ -2,22 +2,121 @@
 # File: app.py
 # Purpose: Functions used by the bot, similar to lib.rs 
 # Created: January 25, 2024
-# Modified: October 5, 2024
+# Modified: October 18, 2026
 
+import asyncio
+import atexit
+import bisect
+import concurrent.futures
+import copy
 import csv
+import functools
+import gzip
+import json
 import logging
 import math
 import os
-from datetime import datetime
+import queue
+import re
+import shutil
+import sqlite3
+import sys
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+from time import perf_counter, time
 
 import discord
 
 formatter = logging.Formatter("%(asctime)s %(levelname)s %(message)s")
-logging.basicConfig(filemode="a", format="%(asctime)s,%(msecs)d %(name)s %(levelname)s %(message)s", datefmt="%H:%M:%S", level=logging.DEBUG)
+
+# Log files are rotated once they reach log_max_bytes ("size") or at log_when ("time", see TimedRotatingFileHandler), keeping log_backups gzipped old files. Set from the bot configuration with log_setup().
+log_rotate = "size"
+log_max_bytes = 10 * 1024 * 1024
+log_backups = 5
+log_when = "midnight"
+
+# Loggers only put records on this queue, a single background thread writes them to the files so the event loop never waits on the disk
+_logqueue = queue.SimpleQueue()
+_loghandlers = {}
+_loghandlerslock = threading.Lock()
+
+def _lognamer(name):
+    return name + ".gz"
+
+def _logrotator(source, dest):
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+# The one handler that writes to a file, shared by every logger logging to it
+def _logfilehandler(log_file):
+    with _loghandlerslock:
+        handler = _loghandlers.get(log_file)
+        if not handler:
+            if log_rotate == "time":
+                handler = TimedRotatingFileHandler(log_file, when = log_when, backupCount = log_backups)
+            else:
+                handler = RotatingFileHandler(log_file, maxBytes = log_max_bytes, backupCount = log_backups)
+            handler.setFormatter(formatter)
+            handler.namer = _lognamer
+            handler.rotator = _logrotator
+            _loghandlers[log_file] = handler
+
+    return handler
+
+# Puts records on the log queue along with where they are to be written
+class _LogQueueHandler(QueueHandler):
+    def __init__(self, target):
+        super().__init__(_logqueue)
+        self.target = target
+
+    # The same record goes to every handler up the logger tree, so each one queues its own copy. The message is put together here since the arguments may change once the caller moves on.
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        record.logtarget = self.target
+
+        return record
+
+# Runs on the listener thread and hands each record to the handler for its file
+class _LogRouter(logging.Handler):
+    def handle(self, record):
+        _loghandlers[record.logtarget].handle(record)
+
+        return True
+
+# Console output of everything, which used to come from logging.basicConfig()
+_consolehandler = logging.StreamHandler(sys.stderr)
+_consolehandler.setFormatter(logging.Formatter("%(asctime)s,%(msecs)d %(name)s %(levelname)s %(message)s", datefmt = "%H:%M:%S"))
+_loghandlers["console"] = _consolehandler
+
+logging.getLogger().addHandler(_LogQueueHandler("console"))
+logging.getLogger().setLevel(logging.INFO)
+
+_loglistener = QueueListener(_logqueue, _LogRouter())
+_loglistener.start()
+
+# Stopping the listener writes out whatever is still queued. This runs before the atexit handler of logging itself, which closes the files.
+atexit.register(_loglistener.stop)
+
+def log_setup(level = "INFO", rotate = "size", max_bytes = 10 * 1024 * 1024, backups = 5, when = "midnight"):
+    global log_rotate, log_max_bytes, log_backups, log_when
+
+    log_rotate = rotate
+    log_max_bytes = max_bytes
+    log_backups = backups
+    log_when = when
+
+    logging.getLogger().setLevel(level)
 
 def logger_setup(name, log_file, level=logging.INFO):
-    handler = logging.FileHandler(log_file)        
-    handler.setFormatter(formatter)
+    _logfilehandler(log_file)
+    handler = _LogQueueHandler(log_file)
 
     logger = logging.getLogger(name)
     
@@ -27,8 +126,8 @@ def logger_setup(name, log_file, level=logging.INFO):
     return logger
 
 def logger_resetup(logger, log_file, level=logging.INFO):
-    handler = logging.FileHandler(log_file)        
-    handler.setFormatter(formatter)
+    _logfilehandler(log_file)
+    handler = _LogQueueHandler(log_file)
     
     logger.setLevel(level)
     logger.addHandler(handler)
@@ -91,4 +190,587 @@ def mkerrembed(msg):
     embed = discord.Embed(title = "Error", color = 0xff0000)
     embed.add_field(name = "", value = msg)
     
-    return embed
\ No newline at end of file
+    return embed
+
+# Settings for every database opened through Database, set from the bot configuration with db_setup()
+db_busy_timeout = 5.0
+db_readers = 2
+db_cached_statements = 256
+db_thread_connections = 64
+
+_dbwriter = None
+_dbreaders = None
+_dbwal = set()
+# Bumped by dbforget(), connections opened under an older generation are not used again
+_dbgenerations = {}
+_dblocal = threading.local()
+_dbconns = []
+_dbconnslock = threading.Lock()
+_databases = {}
+
+def db_setup(busy_timeout, readers, cached_statements = 256, thread_connections = 64):
+    global db_busy_timeout, db_readers, db_cached_statements, db_thread_connections
+
+    db_busy_timeout = busy_timeout
+    db_readers = readers
+    db_cached_statements = cached_statements
+    db_thread_connections = thread_connections
+
+# Long-lived connection to a database for the calling thread. Each thread keeps its most recently used connections open, with their compiled statements cached by sqlite3.
+def dbconnect(path):
+    conns = getattr(_dblocal, "conns", None)
+    if conns is None:
+        conns = _dblocal.conns = OrderedDict()
+
+    entry = conns.get(path)
+    if entry:
+        dbc, generation = entry
+        if generation == _dbgenerations.get(path, 0):
+            conns.move_to_end(path)
+            return dbc
+
+        # The file was deleted or replaced since this connection was opened, see dbforget()
+        del conns[path]
+        with _dbconnslock:
+            _dbconns.remove(dbc)
+        dbc.close()
+
+    # check_same_thread is off only so db_close() can close every connection at shutdown, a connection is never used by any other thread
+    dbc = sqlite3.connect(path, timeout = db_busy_timeout, cached_statements = db_cached_statements, check_same_thread = False)
+
+    # WAL lets the readers work while the writer has a transaction open. The setting is stored in the database file so this is only needed once.
+    if path not in _dbwal:
+        dbc.execute("PRAGMA journal_mode=WAL")
+        _dbwal.add(path)
+
+    conns[path] = (dbc, _dbgenerations.get(path, 0))
+    with _dbconnslock:
+        _dbconns.append(dbc)
+
+    # Such as with per-user databases, keep the number of open files bounded
+    if len(conns) > db_thread_connections:
+        oldpath, (olddbc, oldgeneration) = conns.popitem(last = False)
+        with _dbconnslock:
+            _dbconns.remove(olddbc)
+        olddbc.close()
+
+    return dbc
+
+# Make every thread open a new connection to "path" the next time it is used, for a file that is about to be deleted or replaced. Otherwise a thread keeps writing through its cached connection to the old file.
+def dbforget(path):
+    _dbgenerations[path] = _dbgenerations.get(path, 0) + 1
+    _dbwal.discard(path)
+
+# Shared Database for a file, every cog using the same file gets the same object
+def getdb(path):
+    db = _databases.get(path)
+    if not db:
+        db = _databases[path] = Database(path)
+
+    return db
+
+# Close every database connection and stop the database threads, for shutdown
+def db_close():
+    global _dbwriter, _dbreaders
+
+    if _dbwriter:
+        _dbwriter.shutdown()
+        _dbreaders.shutdown()
+        _dbwriter = None
+        _dbreaders = None
+
+    with _dbconnslock:
+        for dbc in _dbconns:
+            dbc.close()
+        _dbconns.clear()
+
+# All writes go through a single thread so they never wait on each other for the database lock, reads use a small pool
+def _dbexecutors():
+    global _dbwriter, _dbreaders
+
+    if not _dbwriter:
+        _dbwriter = ThreadPoolExecutor(max_workers = 1, thread_name_prefix = "db_writer")
+        _dbreaders = ThreadPoolExecutor(max_workers = db_readers, thread_name_prefix = "db_reader")
+
+    return _dbwriter, _dbreaders
+
+# Run a blocking function on the database writer thread, for work that needs its own connections such as ATTACH
+async def dbcall(func, *args):
+    writer, readers = _dbexecutors()
+    return await asyncio.get_running_loop().run_in_executor(writer, func, *args)
+
+# Asynchronous access to an SQLite database. The blocking sqlite3 calls run on the shared writer thread and reader pool so the event loop never waits on the disk. Use getdb() rather than creating these directly.
+class Database:
+    def __init__(self, path):
+        self.path = path
+        # Name the timings are recorded under, numbers are left out so per-user and sharded files share one
+        self.label = re.sub(r"\d+", "N", os.path.basename(path))
+
+    def _fetch(self, sql, params, one):
+        start = perf_counter()
+        cur = dbconnect(self.path).execute(sql, params)
+        if one:
+            res = cur.fetchone()
+        else:
+            res = cur.fetchall()
+        metrics.observe("db", f"{self.label} read", perf_counter() - start)
+
+        return res
+
+    # Write a list of (sql, params) in a single transaction, consecutive statements with the same SQL are sent with executemany()
+    def _writebatch(self, statements):
+        start = perf_counter()
+        dbc = dbconnect(self.path)
+        try:
+            with dbc:
+                rowcount = 0
+                runsql = None
+                runparams = []
+                for sql, params in statements:
+                    if sql != runsql and runparams:
+                        rowcount += dbc.executemany(runsql, runparams).rowcount
+                        runparams = []
+                    runsql = sql
+                    runparams.append(params)
+
+                if runparams:
+                    rowcount += dbc.executemany(runsql, runparams).rowcount
+
+                return rowcount
+        finally:
+            metrics.observe("db", f"{self.label} write", perf_counter() - start)
+
+    def _executescript(self, script):
+        start = perf_counter()
+        dbc = dbconnect(self.path)
+        dbc.executescript(script)
+        dbc.commit()
+        metrics.observe("db", f"{self.label} write", perf_counter() - start)
+
+    async def _read(self, func, *args):
+        writer, readers = _dbexecutors()
+        return await asyncio.get_running_loop().run_in_executor(readers, func, *args)
+
+    async def _write(self, func, *args):
+        writer, readers = _dbexecutors()
+        return await asyncio.get_running_loop().run_in_executor(writer, func, *args)
+
+    async def fetchone(self, sql, params = ()):
+        return await self._read(self._fetch, sql, params, True)
+
+    async def fetchall(self, sql, params = ()):
+        return await self._read(self._fetch, sql, params, False)
+
+    # Returns the number of rows changed
+    async def execute(self, sql, params = ()):
+        return await self._write(self._writebatch, [(sql, params)])
+
+    async def executemany(self, sql, seq):
+        return await self._write(self._writebatch, [(sql, params) for params in seq])
+
+    async def executebatch(self, statements):
+        return await self._write(self._writebatch, statements)
+
+    async def executescript(self, script):
+        return await self._write(self._executescript, script)
+
+# Bounded in-memory cache that drops the least recently used entries first, with hit and miss counters
+class LRUCache:
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+
+        if len(self.entries) > self.size:
+            self.entries.popitem(last = False)
+
+    def pop(self, key):
+        return self.entries.pop(key, None)
+
+    def stats(self):
+        return f"{len(self.entries)}/{self.size} entries, {self.hits} hits, {self.misses} misses"
+
+# Base for queues that are written out by a background task once they are full or every "interval" seconds. Subclasses call queued() after adding to their queue, write it out in _flush() and write whatever is left without the event loop in _drain().
+class PeriodicFlush(ABC):
+    def __init__(self, interval):
+        self.interval = interval
+        self.task = None
+        self.wake = None
+        # Flushes run one at a time so what was queued first is written first
+        self.lock = asyncio.Lock()
+        # Work handed to a thread by _submit() that has not finished yet
+        self.inflight = set()
+
+    def start(self):
+        if self.task and not self.task.done():
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Such as a cog queueing its last rows from cog_unload once the loop is gone, stop() writes them out
+            self.task = None
+            return
+
+        self.wake = asyncio.Event()
+        self.task = loop.create_task(self._run())
+
+    def queued(self, full):
+        self.start()
+
+        if full and self.task:
+            self.wake.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+            self.wake.clear()
+            try:
+                await self.flush()
+            except Exception:
+                # Such as a network error while posting, the task has to keep going or nothing is flushed until a restart
+                logging.getLogger("sys_logger").exception(f"{type(self).__name__} flush failed")
+
+    async def flush(self):
+        async with self.lock:
+            await self._flush()
+
+    @abstractmethod
+    async def _flush(self):
+        pass
+
+    @abstractmethod
+    def _drain(self):
+        pass
+
+    # Run a blocking write in a thread of "executor". It is shielded so cancelling the task does not take back work the thread has not started on yet, stop() waits for it instead.
+    async def _submit(self, executor, func, *args):
+        future = executor.submit(func, *args)
+        self.inflight.add(future)
+        future.add_done_callback(self.inflight.discard)
+
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    # Stop the background task, wait for the work already handed to threads and write out anything still queued. This blocks, it is meant for cog unload and shutdown.
+    def stop(self):
+        # A task that is already done, such as one cancelled by the client at shutdown, is left alone as its loop may be closed
+        if self.task and not self.task.done():
+            self.task.cancel()
+        self.task = None
+
+        concurrent.futures.wait(list(self.inflight))
+
+        self._drain()
+
+# Write-behind queue for SQLite writes. Statements are kept in memory and written in batched transactions from a background task once "maxsize" statements are queued or "interval" seconds have passed.
+class BatchWriter(PeriodicFlush):
+    def __init__(self, maxsize = 500, interval = 5.0):
+        super().__init__(interval)
+        self.maxsize = maxsize
+        self.queue = {}
+        self.count = 0
+
+    def put(self, path, sql, params):
+        self.queue.setdefault(path, []).append((sql, params))
+        self.count += 1
+
+        self.queued(self.count >= self.maxsize)
+
+    async def _flush(self):
+        # The statements of a file stay in the queue until they are handed to the writer thread, so a cancelled flush leaves the rest for stop()
+        for path in list(self.queue):
+            statements = self.queue.pop(path, None)
+            if not statements:
+                continue
+            self.count -= len(statements)
+
+            writer, readers = _dbexecutors()
+            await self._submit(writer, self._write, path, statements)
+
+    @staticmethod
+    def _write(path, statements):
+        db = getdb(path)
+
+        try:
+            db._writebatch(statements)
+            return
+        except sqlite3.OperationalError as err:
+            # Such as "database is locked" once the busy timeout has passed, the batch is tried once more as a whole
+            logging.getLogger("sys_logger").warning(f"Batched write of {len(statements)} statements to {path} failed, retrying: {err}")
+            try:
+                db._writebatch(statements)
+                return
+            except sqlite3.Error:
+                pass
+        except sqlite3.Error as err:
+            logging.getLogger("sys_logger").warning(f"Batched write of {len(statements)} statements to {path} failed: {err}")
+
+        # A single bad statement rolls back the whole transaction, so the statements are written one at a time and only the ones that fail are lost
+        failed = 0
+        lasterr = None
+        for statement in statements:
+            try:
+                db._writebatch([statement])
+            except sqlite3.Error as err:
+                failed += 1
+                lasterr = err
+
+        if failed:
+            logging.getLogger("sys_logger").error(f"{failed} of {len(statements)} statements to {path} failed: {lasterr}")
+
+    def _drain(self):
+        queue = self.queue
+        self.queue = {}
+        self.count = 0
+
+        for path, statements in queue.items():
+            self._write(path, statements)
+
+# Counts of durations in seconds, bucketed so percentiles can be estimated without keeping every value
+class Histogram:
+    buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        # The last count is for durations above the largest bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    # Upper bound of the bucket that the given fraction of durations fall in
+    def quantile(self, q):
+        target = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= target:
+                return min(bound, self.max)
+
+        return self.max
+
+# Timings of the bot itself: event loop lag, commands, listeners and database access. Each timing is recorded under a kind and a name, such as ("command", "micron fbga") or ("db", "knowncodes.db read"). Values that are read when asked for, like the gateway latency, are added with gauge().
+class Metrics:
+    def __init__(self):
+        self.histograms = {}
+        self.gauges = {}
+        self.lock = threading.Lock()
+        self.lagtask = None
+        self.server = None
+
+    # Safe to call from the database threads
+    def observe(self, kind, name, seconds):
+        with self.lock:
+            hist = self.histograms.get((kind, name))
+            if not hist:
+                hist = self.histograms[(kind, name)] = Histogram()
+            hist.observe(seconds)
+
+    def gauge(self, name, func):
+        self.gauges[name] = func
+
+    # Decorator that records how long each call of a coroutine function takes, under its qualified name unless "name" is given
+    def timed(self, kind, name = None):
+        def decorator(func):
+            label = name or func.__qualname__
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                start = perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self.observe(kind, label, perf_counter() - start)
+
+            return wrapper
+
+        return decorator
+
+    # How late the event loop wakes up a task that sleeps for "interval" seconds, anything above zero is time the loop was busy with something else
+    async def _looplag(self, interval):
+        while True:
+            start = perf_counter()
+            await asyncio.sleep(interval)
+            self.observe("loop", "lag", max(0.0, perf_counter() - start - interval))
+
+    def start(self, interval = 0.5):
+        if not self.lagtask:
+            self.lagtask = asyncio.get_running_loop().create_task(self._looplag(interval))
+
+    # Every histogram of a kind, sorted by the total time spent in it
+    def top(self, kind, count = 10):
+        with self.lock:
+            rows = [(name, hist) for (histkind, name), hist in self.histograms.items() if histkind == kind]
+
+        rows.sort(key = lambda row: row[1].sum, reverse = True)
+
+        return rows[:count]
+
+    # Everything in the Prometheus text format
+    def prometheus(self):
+        lines = []
+
+        def escape(value):
+            return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+        with self.lock:
+            items = sorted(self.histograms.items())
+
+        kinds = {}
+        for (kind, name), hist in items:
+            kinds.setdefault(kind, []).append((name, hist))
+
+        for kind, hists in kinds.items():
+            metric = f"slag_{kind}_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            for name, hist in hists:
+                label = f'name="{escape(name)}"'
+                total = 0
+                for bound, count in zip(hist.buckets, hist.counts):
+                    total += count
+                    lines.append(f'{metric}_bucket{{{label},le="{bound}"}} {total}')
+                lines.append(f'{metric}_bucket{{{label},le="+Inf"}} {hist.count}')
+                lines.append(f"{metric}_sum{{{label}}} {hist.sum}")
+                lines.append(f"{metric}_count{{{label}}} {hist.count}")
+
+        for name, func in self.gauges.items():
+            try:
+                value = float(func())
+            except Exception:
+                continue
+            lines.append(f"# TYPE slag_{name} gauge")
+            lines.append(f"slag_{name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    async def _handle(self, reader, writer):
+        try:
+            # Whatever was asked for, the only thing served is the metrics
+            while (await reader.readline()).strip():
+                pass
+
+            body = self.prometheus().encode()
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\nContent-Length: " + str(len(body)).encode() + b"\r\nConnection: close\r\n\r\n" + body)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    # Serve prometheus() over HTTP, meant for a local scraper so it listens on localhost by default
+    async def serve(self, port, host = "127.0.0.1"):
+        if not self.server:
+            self.server = await asyncio.start_server(self._handle, host, port)
+
+        return self.server
+
+metrics = Metrics()
+
+# Append-only log of guild, member and message events as JSON lines, one file per UTC day. Events are written in blocks, and each block gets a line in a sidecar .idx file with its byte range, time range and the events, guilds, channels and users in it, so eventquery.py only has to read the blocks that can match. Does nothing unless turned on with eventlog_setup().
+class EventLog(PeriodicFlush):
+    def __init__(self, directory = "data/events", blocksize = 1000, interval = 10.0):
+        super().__init__(interval)
+        self.enabled = False
+        self.directory = directory
+        self.blocksize = blocksize
+        self.block = []
+        # A single thread so the blocks are appended in order
+        self.executor = None
+
+    def write(self, event, guild = None, channel = None, user = None, **fields):
+        if not self.enabled:
+            return
+
+        entry = {"t": round(time(), 3), "event": event}
+        for key, value in (("guild", guild), ("channel", channel), ("user", user)):
+            if value:
+                entry[key] = value
+        entry.update(fields)
+
+        self.block.append(entry)
+
+        self.queued(len(self.block) >= self.blocksize)
+
+    async def _flush(self):
+        block = self.block
+        self.block = []
+
+        if block:
+            if not self.executor:
+                self.executor = ThreadPoolExecutor(max_workers = 1, thread_name_prefix = "eventlog")
+            await self._submit(self.executor, self._writeblock, block)
+
+    def _drain(self):
+        block = self.block
+        self.block = []
+
+        if block:
+            self._writeblock(block)
+
+    def _writeblock(self, block):
+        days = {}
+        for entry in block:
+            day = datetime.fromtimestamp(entry["t"], timezone.utc).strftime("%Y-%m-%d")
+            days.setdefault(day, []).append(entry)
+
+        os.makedirs(self.directory, exist_ok = True)
+
+        for day, entries in days.items():
+            data = "".join(json.dumps(entry, separators = (",", ":")) + "\n" for entry in entries).encode()
+            path = os.path.join(self.directory, f"events-{day}")
+
+            try:
+                with open(f"{path}.jsonl", "ab") as f:
+                    offset = f.tell()
+                    f.write(data)
+
+                index = {
+                    "offset": offset,
+                    "length": len(data),
+                    "count": len(entries),
+                    "start": min(entry["t"] for entry in entries),
+                    "end": max(entry["t"] for entry in entries),
+                    "events": sorted(set(entry["event"] for entry in entries)),
+                    "guilds": sorted(set(entry["guild"] for entry in entries if "guild" in entry)),
+                    "channels": sorted(set(entry["channel"] for entry in entries if "channel" in entry)),
+                    "users": sorted(set(entry["user"] for entry in entries if "user" in entry))
+                }
+
+                # A block missing from the index because of a crash or an error here is still found by eventquery.py, it reads any bytes no index line covers in full
+                with open(f"{path}.idx", "a") as f:
+                    f.write(json.dumps(index, separators = (",", ":")) + "\n")
+            except OSError as err:
+                logging.getLogger("sys_logger").error(f"Writing {len(entries)} events to {path}.jsonl failed: {err}")
+
+eventlog = EventLog()
+
+def eventlog_setup(enabled, directory = "data/events", blocksize = 1000, interval = 10.0):
+    eventlog.enabled = enabled
+    eventlog.directory = directory
+    eventlog.blocksize = blocksize
+    eventlog.interval = interval